@@ -1,15 +1,23 @@
+import ast
+import asyncio
 import os
+import secrets
 import uuid
 
-from fastapi import APIRouter, Depends, File, HTTPException, UploadFile
+from fastapi import APIRouter, Depends, File, Header, HTTPException, Query, Request, Response, UploadFile
+from fastapi.responses import JSONResponse, StreamingResponse
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
+from starlette.requests import ClientDisconnect
 
 from ..config import settings
 from ..database import get_db
-from ..models import Check, ChecklistItem, CheckType, Issue, Photo, Property, Room
+from ..models import Check, ChecklistItem, CheckType, Issue, Photo, Property, Room, UploadSession
+from ..profiling import traces
 from ..schemas import (
+    BulkImportRequest,
+    BulkImportResponse,
     CheckCreate,
     ChecklistItemCreate,
     ChecklistItemResponse,
@@ -19,12 +27,50 @@ from ..schemas import (
     PropertyResponse,
     RoomCreate,
     RoomResponse,
+    UploadSessionCreate,
+    UploadSessionResponse,
+)
+from ..services import (
+    BulkImportError,
+    ChunkError,
+    OffsetMismatchError,
+    Priority,
+    admission,
+    analyze_room_photo,
+    apply_room_analysis,
+    claim_part,
+    coalesce,
+    compare_photos,
+    content_hash,
+    export_csv,
+    export_json,
+    find_duplicate,
+    import_properties,
+    model_state,
+    parse_content_range,
+    parse_csv,
+    parse_json,
+    part_path,
+    perceptual_hash,
+    room_locks,
+    single_flight,
+    write_chunk,
 )
-from ..services import analyze_room_photo, compare_photos
 
 router = APIRouter()
 
 
+# Health
+@router.get("/health/live")
+async def liveness():
+    return {"status": "ok"}
+
+
+@router.get("/health/ready")
+async def readiness():
+    return JSONResponse(model_state.as_dict(), status_code=200 if model_state.ready else 503)
+
+
 # Properties
 @router.post("/properties", response_model=PropertyResponse)
 async def create_property(data: PropertyCreate, db: AsyncSession = Depends(get_db)):
@@ -112,64 +158,259 @@ async def list_checks(property_id: int, db: AsyncSession = Depends(get_db)):
 
 
 # Photo Upload & Analysis
-@router.post("/checks/{check_id}/photos/{room_id}")
-async def upload_and_analyze_photo(
-    check_id: int, room_id: int, file: UploadFile = File(...), db: AsyncSession = Depends(get_db)
-):
-    os.makedirs(settings.upload_dir, exist_ok=True)
-    ext = file.filename.split(".")[-1] if file.filename else "jpg"
-    filename = f"{uuid.uuid4()}.{ext}"
-    file_path = os.path.join(settings.upload_dir, filename)
-
-    with open(file_path, "wb") as f:
-        f.write(await file.read())
-
-    # Get room and checklist
+async def _get_room(db: AsyncSession, room_id: int) -> Room:
     room_result = await db.execute(select(Room).where(Room.id == room_id))
     room = room_result.scalar_one_or_none()
     if not room:
         raise HTTPException(404, "Room not found")
+    return room
+
+
+async def _analyze_photo(
+    db: AsyncSession, check_id: int, room: Room, data: bytes, ext: str, staged_path: str | None = None
+) -> dict:
+    """Store a photo and analyze it, or link it to an existing duplicate.
+
+    ``staged_path`` is a file already holding ``data`` (e.g. an assembled chunked upload); it is
+    moved into place instead of writing the bytes again.
+    """
+
+    room_id = room.id
+    sha256 = content_hash(data)
+    phash = await asyncio.to_thread(perceptual_hash, data)
+
+    def store_file() -> str:
+        os.makedirs(settings.upload_dir, exist_ok=True)
+        file_path = os.path.join(settings.upload_dir, f"{uuid.uuid4()}.{ext}")
+        if staged_path:
+            os.replace(staged_path, file_path)
+        else:
+            with open(file_path, "wb") as f:
+                f.write(data)
+        return file_path
+
+    def discard_file(file_path: str) -> None:
+        # Nothing refers to a new file until the commit; a staged upload goes back so the client can finalize again
+        if staged_path:
+            os.replace(file_path, staged_path)
+        else:
+            os.remove(file_path)
+
+    async def find_original() -> Photo | None:
+        # Reuse the analysis of an identical or near-identical photo already taken for this check and room
+        existing_result = await db.execute(select(Photo).where(Photo.check_id == check_id, Photo.room_id == room_id))
+        original = find_duplicate(existing_result.scalars().all(), sha256, phash, settings.photo_duplicate_threshold)
+        if original and original.duplicate_of_id:
+            original = await db.get(Photo, original.duplicate_of_id)
+        return original
+
+    async def link_to(original: Photo) -> dict:
+        # Exact duplicates share the original file; near duplicates keep their own frame
+        reuse_file = original.content_hash == sha256
+        file_path = original.file_path if reuse_file else store_file()
+        photo = Photo(
+            check_id=check_id,
+            room_id=room_id,
+            file_path=file_path,
+            analysis_result=original.analysis_result,
+            content_hash=sha256,
+            perceptual_hash=phash,
+            duplicate_of_id=original.id,
+        )
+        db.add(photo)
+        try:
+            await db.commit()
+        except BaseException:
+            if not reuse_file:
+                discard_file(file_path)
+            raise
+        if reuse_file and staged_path:
+            os.remove(staged_path)
+        return {
+            "photo_id": photo.id,
+            "analysis": ast.literal_eval(original.analysis_result),
+            "issues_created": 0,
+            "issues_resolved": 0,
+            "duplicate_of": original.id,
+        }
+
+    # Finding a duplicate and storing the photo happen under the room's lock, so concurrent
+    # uploads of the same photo can't both miss each other and each be stored as an original
+    async with room_locks.hold((check_id, room_id)):
+        original = await find_original()
+        if original:
+            return await link_to(original)
 
     items_result = await db.execute(select(ChecklistItem).where(ChecklistItem.room_id == room_id))
     items = items_result.scalars().all()
     item_names = [i.name for i in items]
     item_costs = {i.name: i.replacement_cost for i in items}
 
-    # Analyze with vision
-    analysis = await analyze_room_photo(file_path, item_names, room.name)
+    file_path = store_file()
+
+    # Analyze with vision; concurrent uploads of the same image share one model call
+    async def analyze():
+        async with admission.slot(Priority.INTERACTIVE, room.property_id):
+            return await analyze_room_photo(file_path, item_names, room.name)
+
+    try:
+        analysis = await single_flight.do(("analyze", sha256, tuple(item_names), room.name), analyze)
+    except BaseException:
+        discard_file(file_path)
+        raise
+
+    # The lock isn't held during analysis, so different photos of a room are analyzed concurrently
+    async with room_locks.hold((check_id, room_id)):
+        try:
+            # A concurrent upload of the same photo may have been stored while this one was analyzed
+            original = await find_original()
+            if not original:
+                photo = Photo(
+                    check_id=check_id,
+                    room_id=room_id,
+                    file_path=file_path,
+                    analysis_result=str(analysis),
+                    content_hash=sha256,
+                    perceptual_hash=phash,
+                )
+                db.add(photo)
+
+                # Merge into the room's consolidated issues
+                created, resolved = await apply_room_analysis(db, check_id, room_id, analysis, item_costs)
+
+                await db.commit()
+        except BaseException:
+            discard_file(file_path)
+            raise
+        if original:
+            discard_file(file_path)
+            return await link_to(original)
+    return {
+        "photo_id": photo.id,
+        "analysis": analysis,
+        "issues_created": len(created),
+        "issues_resolved": len(resolved),
+        "duplicate_of": None,
+    }
 
-    # Save photo record
-    photo = Photo(check_id=check_id, room_id=room_id, file_path=file_path, analysis_result=str(analysis))
-    db.add(photo)
 
-    # Create issues for missing items and damage
-    issues = []
-    for missing in analysis.get("missing_items", []):
-        cost = item_costs.get(missing, 0)
-        issue = Issue(
-            check_id=check_id,
-            description=f"Missing: {missing}",
-            item_name=missing,
-            estimated_cost=cost,
-            severity="medium",
-        )
-        db.add(issue)
-        issues.append(issue)
+def _extension(filename: str | None) -> str:
+    return filename.split(".")[-1] if filename else "jpg"
+
+
+@router.post("/checks/{check_id}/photos/{room_id}")
+async def upload_and_analyze_photo(
+    check_id: int, room_id: int, file: UploadFile = File(...), db: AsyncSession = Depends(get_db)
+):
+    room = await _get_room(db, room_id)
+    data = await file.read()
+    return await _analyze_photo(db, check_id, room, data, _extension(file.filename))
+
+
+# Resumable Uploads
+async def _get_upload(db: AsyncSession, upload_id: str) -> UploadSession:
+    upload = await db.get(UploadSession, upload_id)
+    if not upload:
+        raise HTTPException(404, "Upload not found")
+    return upload
+
+
+@router.post("/checks/{check_id}/photos/{room_id}/uploads", response_model=UploadSessionResponse, status_code=201)
+async def create_upload_session(
+    check_id: int, room_id: int, data: UploadSessionCreate, db: AsyncSession = Depends(get_db)
+):
+    await _get_room(db, room_id)
+    if data.size > settings.upload_max_bytes:
+        raise HTTPException(413, f"Uploads are limited to {settings.upload_max_bytes} bytes")
+    upload = UploadSession(
+        id=str(uuid.uuid4()),
+        check_id=check_id,
+        room_id=room_id,
+        filename=data.filename,
+        size=data.size,
+        sha256=data.sha256.lower() if data.sha256 else None,
+        offset=0,
+    )
+    db.add(upload)
+    await db.commit()
+    await db.refresh(upload)
+    return upload
+
+
+@router.get("/uploads/{upload_id}", response_model=UploadSessionResponse)
+async def get_upload_session(upload_id: str, response: Response, db: AsyncSession = Depends(get_db)):
+    upload = await _get_upload(db, upload_id)
+    response.headers["Upload-Offset"] = str(upload.offset)
+    return upload
+
+
+@router.put("/uploads/{upload_id}", response_model=UploadSessionResponse)
+async def upload_chunk(upload_id: str, request: Request, response: Response, db: AsyncSession = Depends(get_db)):
+    upload = await _get_upload(db, upload_id)
+
+    async def body():
+        # Keep whatever arrived before the client went away so it can resume from there
+        try:
+            async for chunk in request.stream():
+                yield chunk
+        except ClientDisconnect:
+            return
 
-    for damage in analysis.get("damage_detected", []):
-        issue = Issue(check_id=check_id, description=damage, severity="high")
-        db.add(issue)
-        issues.append(issue)
+    try:
+        start, end = parse_content_range(request.headers.get("content-range"), upload.size)
+        upload.offset = await write_chunk(upload, start, end, body())
+    except ChunkError as e:
+        status = 409 if isinstance(e, OffsetMismatchError) else 400
+        raise HTTPException(status, str(e), headers={"Upload-Offset": str(upload.offset)}) from e
 
     await db.commit()
-    return {"photo_id": photo.id, "analysis": analysis, "issues_created": len(issues)}
+    response.headers["Upload-Offset"] = str(upload.offset)
+    return upload
+
+
+@router.post("/uploads/{upload_id}/finalize")
+async def finalize_upload(upload_id: str, db: AsyncSession = Depends(get_db)):
+    upload = await _get_upload(db, upload_id)
+    if upload.offset != upload.size:
+        raise HTTPException(
+            409,
+            f"Upload incomplete: {upload.offset} of {upload.size} bytes",
+            headers={"Upload-Offset": str(upload.offset)},
+        )
+
+    # Taking the file makes a retried finalize fail fast instead of analyzing the photo twice
+    path = claim_part(upload.id)
+    if path is None:
+        raise HTTPException(409, "Upload is already being finalized")
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+        if upload.sha256 and content_hash(data) != upload.sha256:
+            # The assembled file is corrupt; start over rather than analyzing it
+            os.remove(path)
+            upload.offset = 0
+            await db.commit()
+            raise HTTPException(422, "Checksum mismatch, upload restarted", headers={"Upload-Offset": "0"})
+
+        room = await _get_room(db, upload.room_id)
+        check_id, ext = upload.check_id, _extension(upload.filename)
+        await db.delete(upload)
+        return await _analyze_photo(db, check_id, room, data, ext, staged_path=path)
+    finally:
+        # Still there if finalizing failed, so the client can try again
+        if os.path.exists(path):
+            os.replace(path, part_path(upload_id))
 
 
 # Damage Report
 @router.get("/properties/{property_id}/damage-report")
-async def generate_damage_report(
-    property_id: int, checkin_id: int, checkout_id: int, db: AsyncSession = Depends(get_db)
-):
+async def generate_damage_report(property_id: int, checkin_id: int, checkout_id: int):
+    # Concurrent requests for the same report (e.g. host and co-host, or retries) share one computation
+    key = f"damage-report:{property_id}:{checkin_id}:{checkout_id}"
+    return await coalesce(key, lambda db: _build_damage_report(db, property_id, checkin_id, checkout_id))
+
+
+async def _build_damage_report(db: AsyncSession, property_id: int, checkin_id: int, checkout_id: int) -> dict:
     # Get checks with photos
     checkin_result = await db.execute(
         select(Check)
@@ -193,13 +434,18 @@ async def generate_damage_report(
 
     # Compare photos by room
     comparisons = []
-    checkin_by_room = {p.room_id: p for p in checkin.photos}
+    checkin_by_room = {p.room_id: p for p in checkin.photos if p.duplicate_of_id is None}
     for photo in checkout.photos:
-        if photo.room_id in checkin_by_room:
+        if photo.duplicate_of_id is None and photo.room_id in checkin_by_room:
             before = checkin_by_room[photo.room_id]
             room_result = await db.execute(select(Room).where(Room.id == photo.room_id))
             room = room_result.scalar_one()
-            comparison = await compare_photos(before.file_path, photo.file_path, room.name)
+
+            async def compare(before_path=before.file_path, after_path=photo.file_path, room_name=room.name):
+                async with admission.slot(Priority.BACKGROUND, property_id):
+                    return await compare_photos(before_path, after_path, room_name)
+
+            comparison = await single_flight.do(("compare", before.file_path, photo.file_path, room.name), compare)
             comparisons.append(
                 {
                     "room_id": photo.room_id,
@@ -261,3 +507,72 @@ async def get_cost_history(property_id: int, db: AsyncSession = Depends(get_db))
     )
     rows = result.all()
     return [{"issue": IssueResponse.model_validate(r[0]), "date": r[1], "guest": r[2]} for r in rows]
+
+
+# Vision Queue
+@router.get("/vision/queue")
+async def get_vision_queue_metrics():
+    return admission.metrics()
+
+
+# Admin: slow-request traces
+def _require_admin(x_admin_token: str | None = Header(None)) -> None:
+    # Traces hold SQL and timings of other users' requests, so they are hidden unless profiling is on
+    if not settings.profiling_enabled:
+        raise HTTPException(404, "Not Found")
+    if not settings.admin_token or not secrets.compare_digest(x_admin_token or "", settings.admin_token):
+        raise HTTPException(403, "Invalid admin token")
+
+
+@router.get("/admin/traces", dependencies=[Depends(_require_admin)])
+async def list_traces():
+    return [t.summary() for t in reversed(traces)]
+
+
+@router.get("/admin/traces/{trace_id}", dependencies=[Depends(_require_admin)])
+async def get_trace(trace_id: int):
+    for trace in traces:
+        if trace.id == trace_id:
+            return trace.as_dict()
+    raise HTTPException(404, "Trace not found")
+
+
+# Bulk Import/Export
+@router.post("/bulk/import", response_model=BulkImportResponse)
+async def bulk_import(data: BulkImportRequest, db: AsyncSession = Depends(get_db)):
+    return await import_properties(db, data.properties)
+
+
+@router.post("/bulk/import/file", response_model=BulkImportResponse)
+async def bulk_import_file(file: UploadFile = File(...), db: AsyncSession = Depends(get_db)):
+    try:
+        text = (await file.read()).decode("utf-8-sig")
+    except UnicodeDecodeError as e:
+        raise HTTPException(422, "Import file must be UTF-8 encoded") from e
+    is_csv = (file.filename or "").lower().endswith(".csv") or file.content_type == "text/csv"
+    try:
+        properties = parse_csv(text) if is_csv else parse_json(text)
+    except BulkImportError as e:
+        raise HTTPException(422, str(e)) from e
+    return await import_properties(db, properties)
+
+
+@router.get("/bulk/export")
+async def bulk_export(
+    format: str = Query("json", pattern="^(json|csv)$"),
+    property_id: int | None = None,
+    db: AsyncSession = Depends(get_db),
+):
+    export = export_csv if format == "csv" else export_json
+
+    async def body():
+        # The request session is released before the response body is sent, so close it ourselves once done
+        try:
+            async for chunk in export(db, property_id):
+                yield chunk
+        finally:
+            await db.close()
+
+    media_type = "text/csv" if format == "csv" else "application/json"
+    headers = {"Content-Disposition": f'attachment; filename="properties.{format}"'}
+    return StreamingResponse(body(), media_type=media_type, headers=headers)
@@ -0,0 +1,146 @@
+"""Command line tools for the checkout checker backend.
+
+Usage:
+    python -m app.cli import properties.csv
+    python -m app.cli export --format json --output properties.json
+    python -m app.cli retention --dry-run
+    python -m app.cli init-db
+    python -m app.cli startup-time --runs 5
+"""
+
+import argparse
+import asyncio
+import statistics
+import subprocess
+import sys
+from collections.abc import Awaitable
+from pathlib import Path
+
+from .database import async_session, dispose_engine, init_db
+from .services import (
+    BulkImportError,
+    apply_retention,
+    export_csv,
+    export_json,
+    import_properties,
+    parse_csv,
+    parse_json,
+)
+
+
+async def _run(command: Awaitable[int]) -> int:
+    # aiosqlite keeps a thread per pooled connection, which would keep the process alive
+    try:
+        return await command
+    finally:
+        await dispose_engine()
+
+
+async def _import(path: Path) -> int:
+    try:
+        text = path.read_text(encoding="utf-8-sig")
+        properties = parse_csv(text) if path.suffix.lower() == ".csv" else parse_json(text)
+    except (BulkImportError, UnicodeDecodeError) as e:
+        print(f"Invalid import file: {e}", file=sys.stderr)
+        return 1
+
+    await init_db()
+    async with async_session() as db:
+        result = await import_properties(db, properties)
+    print(
+        f"Imported {result['properties_created']} properties, "
+        f"{result['rooms_created']} rooms, {result['items_created']} checklist items"
+    )
+    return 0
+
+
+async def _export(fmt: str, property_id: int | None, output: Path | None) -> int:
+    export = export_csv if fmt == "csv" else export_json
+    out = output.open("w", encoding="utf-8", newline="") if output else sys.stdout
+    try:
+        async with async_session() as db:
+            async for chunk in export(db, property_id):
+                out.write(chunk)
+    finally:
+        if output:
+            out.close()
+    return 0
+
+
+async def _retention(dry_run: bool) -> int:
+    await init_db()
+    async with async_session() as db:
+        report = await apply_retention(db, dry_run=dry_run)
+    prefix = "Would reclaim" if dry_run else "Reclaimed"
+    print(f"{prefix} {report['bytes_reclaimed']} bytes")
+    print(
+        f"  recompressed {report['recompressed']} photos ({report['recompressed_bytes_saved']} bytes saved)\n"
+        f"  archived {report['archived']} photos ({report['archived_bytes']} bytes moved)\n"
+        f"  deleted {report['orphans_deleted']} orphaned files ({report['orphan_bytes_reclaimed']} bytes)"
+    )
+    return 0
+
+
+async def _init_db() -> int:
+    await init_db()
+    print("Database schema is up to date")
+    return 0
+
+
+_IMPORT_TIMER = """
+import time
+started = time.perf_counter()
+import app.main
+print(time.perf_counter() - started)
+"""
+
+
+def _startup_time(runs: int) -> int:
+    # Each run is a fresh interpreter, as a new worker would be, so nothing is already imported
+    timings = []
+    for _ in range(runs):
+        result = subprocess.run([sys.executable, "-c", _IMPORT_TIMER], capture_output=True, text=True, check=True)
+        timings.append(float(result.stdout.strip().splitlines()[-1]) * 1000)
+    print(
+        f"import app.main over {runs} runs: "
+        f"min {min(timings):.1f} ms, median {statistics.median(timings):.1f} ms, max {max(timings):.1f} ms"
+    )
+    return 0
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.cli")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    import_cmd = commands.add_parser("import", help="Import properties, rooms and checklist items from CSV or JSON")
+    import_cmd.add_argument("path", type=Path)
+
+    export_cmd = commands.add_parser("export", help="Export properties, rooms and checklist items")
+    export_cmd.add_argument("--format", choices=["json", "csv"], default="json")
+    export_cmd.add_argument("--property-id", type=int)
+    export_cmd.add_argument("--output", "-o", type=Path)
+
+    retention_cmd = commands.add_parser(
+        "retention", help="Recompress old photos, archive photos of closed checks and delete orphaned files"
+    )
+    retention_cmd.add_argument("--dry-run", action="store_true", help="Report what would change without changing it")
+
+    commands.add_parser("init-db", help="Create missing database tables (run once before starting several workers)")
+
+    startup_cmd = commands.add_parser("startup-time", help="Measure how long a fresh process takes to import the app")
+    startup_cmd.add_argument("--runs", type=int, default=5)
+
+    args = parser.parse_args(argv)
+    if args.command == "init-db":
+        return asyncio.run(_run(_init_db()))
+    if args.command == "startup-time":
+        return _startup_time(args.runs)
+    if args.command == "import":
+        return asyncio.run(_run(_import(args.path)))
+    if args.command == "retention":
+        return asyncio.run(_run(_retention(args.dry_run)))
+    return asyncio.run(_run(_export(args.format, args.property_id, args.output)))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,9 +3,36 @@ from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
     database_url: str = "sqlite+aiosqlite:///./checkout.db"
+    database_echo: bool = False
+    db_init_on_startup: bool = True
     ollama_host: str = "http://localhost:11434"
     ollama_model: str = "llava"
+    ollama_keep_alive: str = "30m"
+    ollama_preload: bool = True
+    ollama_ping_interval: float = 60.0
+    ollama_required: bool = False
     upload_dir: str = "./uploads"
+    archive_dir: str = "./archive"
+    photo_duplicate_threshold: int = 6
+    photo_recompress_after_days: int = 30
+    photo_recompress_quality: int = 75
+    photo_max_dimension: int = 2048
+    photo_archive_after_days: int = 90
+    retention_interval: float = 24 * 3600
+    profiling_enabled: bool = False
+    profiling_sample_rate: float = 0.01
+    profiling_slow_ms: float = 2000.0
+    profiling_max_traces: int = 50
+    admin_token: str = ""
+    coalesce_lease_ttl: float = 300.0
+    coalesce_result_ttl: float = 5.0
+    coalesce_poll_interval: float = 0.25
+    upload_max_bytes: int = 50 * 1024 * 1024
+    upload_session_ttl: float = 24 * 3600
+    upload_gc_interval: float = 3600
+    vision_max_concurrency: int = 2
+    vision_max_queue: int = 50
+    vision_queue_timeout: float = 60.0
 
     class Config:
         env_file = ".env"
@@ -1,21 +1,40 @@
-from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import DeclarativeBase
 
 from .config import settings
 
-engine = create_async_engine(settings.database_url, echo=True)
-async_session = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+# The engine is built on first use rather than at import, so importing the app stays cheap
+_engine: AsyncEngine | None = None
+_sessionmaker = async_sessionmaker(class_=AsyncSession, expire_on_commit=False)
 
 
 class Base(DeclarativeBase):
     pass
 
 
+def get_engine() -> AsyncEngine:
+    global _engine
+    if _engine is None:
+        _engine = create_async_engine(settings.database_url, echo=settings.database_echo)
+    return _engine
+
+
+def async_session() -> AsyncSession:
+    return _sessionmaker(bind=get_engine())
+
+
 async def get_db():
     async with async_session() as session:
         yield session
 
 
 async def init_db():
-    async with engine.begin() as conn:
+    async with get_engine().begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+
+
+async def dispose_engine():
+    global _engine
+    if _engine is not None:
+        await _engine.dispose()
+        _engine = None
@@ -1,25 +1,65 @@
+import asyncio
+import logging
 import os
 from contextlib import asynccontextmanager
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from fastapi.staticfiles import StaticFiles
 
 from .api import router
 from .config import settings
-from .database import init_db
+from .database import dispose_engine, init_db
+from .profiling import ProfilingMiddleware
+from .services import (
+    AdmissionRejected,
+    check_model,
+    collect_upload_sessions,
+    keep_model_warm,
+    model_state,
+    run_retention,
+)
 
-os.makedirs(settings.upload_dir, exist_ok=True)
+logger = logging.getLogger(__name__)
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    await init_db()
+    os.makedirs(settings.upload_dir, exist_ok=True)
+    os.makedirs(settings.archive_dir, exist_ok=True)
+    # With several workers, run `python -m app.cli init-db` once and set DB_INIT_ON_STARTUP=false instead
+    if settings.db_init_on_startup:
+        await init_db()
+
+    await check_model()
+    if not model_state.reachable:
+        if settings.ollama_required:
+            raise RuntimeError(f"Ollama is not reachable at {settings.ollama_host}: {model_state.last_error}")
+        logger.warning("Ollama is not reachable at %s: %s", settings.ollama_host, model_state.last_error)
+
+    # Preloading can take minutes, so it runs in the background and /api/health/ready reports when it is done
+    warm_task = asyncio.create_task(keep_model_warm(settings.ollama_ping_interval))
+    gc_task = asyncio.create_task(collect_upload_sessions(settings.upload_gc_interval, settings.upload_session_ttl))
+    retention_task = asyncio.create_task(run_retention(settings.retention_interval))
     yield
+    tasks = [warm_task, gc_task, retention_task]
+    for task in tasks:
+        task.cancel()
+    # Let the tasks unwind (and close their sessions) before the engine goes away
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await dispose_engine()
 
 
 app = FastAPI(title="Airbnb Checkout Checker", version="1.0.0", lifespan=lifespan)
 
+
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected_handler(request: Request, exc: AdmissionRejected):
+    return JSONResponse(status_code=429, content={"detail": str(exc)}, headers={"Retry-After": str(exc.retry_after)})
+
+
+app.add_middleware(ProfilingMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["http://localhost:5173"],
@@ -29,4 +69,9 @@ app.add_middleware(
 )
 
 app.include_router(router, prefix="/api")
-app.mount("/uploads", StaticFiles(directory=settings.upload_dir), name="uploads")
+
+# Archived photos keep their file name, so /uploads serves from the archive tier as a fallback.
+# The directories are created in lifespan, so they aren't checked here at import time.
+uploads = StaticFiles(directory=settings.upload_dir, check_dir=False)
+uploads.all_directories.append(settings.archive_dir)
+app.mount("/uploads", uploads, name="uploads")
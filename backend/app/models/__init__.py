@@ -1,3 +1,14 @@
-from .models import Check, ChecklistItem, CheckType, Issue, Photo, Property, Room, RoomType
+from .models import Check, ChecklistItem, CheckType, Issue, Lease, Photo, Property, Room, RoomType, UploadSession
 
-__all__ = ["Check", "ChecklistItem", "CheckType", "Issue", "Photo", "Property", "Room", "RoomType"]
+__all__ = [
+    "Check",
+    "ChecklistItem",
+    "CheckType",
+    "Issue",
+    "Lease",
+    "Photo",
+    "Property",
+    "Room",
+    "RoomType",
+    "UploadSession",
+]
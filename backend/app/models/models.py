@@ -68,6 +68,10 @@ class Photo(Base):
     room_id = Column(Integer, ForeignKey("rooms.id"), nullable=False)
     file_path = Column(String(500), nullable=False)
     analysis_result = Column(Text)
+    content_hash = Column(String(64), index=True)
+    perceptual_hash = Column(String(16))
+    duplicate_of_id = Column(Integer, ForeignKey("photos.id"))
+    recompressed_at = Column(DateTime)
     created_at = Column(DateTime, default=datetime.utcnow)
     check = relationship("Check", back_populates="photos")
 
@@ -76,8 +80,30 @@ class Issue(Base):
     __tablename__ = "issues"
     id = Column(Integer, primary_key=True)
     check_id = Column(Integer, ForeignKey("checks.id"), nullable=False)
+    room_id = Column(Integer, ForeignKey("rooms.id"))
     description = Column(Text, nullable=False)
     item_name = Column(String(255))
     estimated_cost = Column(Float, default=0.0)
     severity = Column(String(50), default="low")
     check = relationship("Check", back_populates="issues")
+
+
+class UploadSession(Base):
+    __tablename__ = "upload_sessions"
+    id = Column(String(36), primary_key=True)
+    check_id = Column(Integer, ForeignKey("checks.id"), nullable=False)
+    room_id = Column(Integer, ForeignKey("rooms.id"), nullable=False)
+    filename = Column(String(255))
+    size = Column(Integer, nullable=False)
+    sha256 = Column(String(64))
+    offset = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class Lease(Base):
+    __tablename__ = "leases"
+    key = Column(String(255), primary_key=True)
+    owner = Column(String(36), nullable=False)
+    expires_at = Column(DateTime, nullable=False)
+    result = Column(Text)
@@ -0,0 +1,146 @@
+"""Opt-in request profiling and slow-request capture.
+
+When enabled, every request records the SQL statements and vision calls it makes with their
+durations. A sampled fraction of requests additionally runs under cProfile. Requests that were
+sampled or that exceeded the latency threshold are kept in a bounded in-memory store.
+"""
+
+import cProfile
+import io
+import itertools
+import pstats
+import random
+import time
+from collections import deque
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .config import settings
+
+MAX_SPANS = 200
+PROFILE_LINES = 40
+
+
+class Trace:
+    def __init__(self, trace_id: int, method: str, path: str):
+        self.id = trace_id
+        self.method = method
+        self.path = path
+        self.started_at = datetime.utcnow()
+        self.status: int | None = None
+        self.duration_ms = 0.0
+        self.sampled = False
+        self.sql: list[dict] = []
+        self.vision: list[dict] = []
+        self.profile: str | None = None
+
+    def add(self, spans: list[dict], **span) -> None:
+        if len(spans) < MAX_SPANS:
+            spans.append(span)
+
+    def summary(self) -> dict:
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "status": self.status,
+            "started_at": self.started_at,
+            "duration_ms": round(self.duration_ms, 2),
+            "sampled": self.sampled,
+            "sql_count": len(self.sql),
+            "sql_ms": round(sum(s["duration_ms"] for s in self.sql), 2),
+            "vision_count": len(self.vision),
+            "vision_ms": round(sum(s["duration_ms"] for s in self.vision), 2),
+        }
+
+    def as_dict(self) -> dict:
+        return {**self.summary(), "sql": self.sql, "vision": self.vision, "profile": self.profile}
+
+
+current_trace: ContextVar[Trace | None] = ContextVar("current_trace", default=None)
+traces: deque[Trace] = deque(maxlen=settings.profiling_max_traces)
+_trace_ids = itertools.count(1)
+_profiling_active = False
+
+
+@contextmanager
+def vision_call(name: str) -> Iterator[None]:
+    """Time a vision model call and attach it to the current request's trace, if there is one."""
+
+    trace = current_trace.get()
+    if trace is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(trace.vision, name=name, duration_ms=_ms_since(started))
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if current_trace.get() is not None:
+        conn.info.setdefault("profiling_started", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    trace = current_trace.get()
+    if trace is not None and conn.info.get("profiling_started"):
+        started = conn.info["profiling_started"].pop()
+        trace.add(trace.sql, statement=statement, duration_ms=_ms_since(started))
+
+
+def _ms_since(started: float) -> float:
+    return round((time.perf_counter() - started) * 1000, 3)
+
+
+class ProfilingMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not settings.profiling_enabled or scope["path"].startswith("/api/admin/"):
+            await self.app(scope, receive, send)
+            return
+
+        global _profiling_active
+        trace = Trace(next(_trace_ids), scope["method"], scope["path"])
+        # cProfile is per thread, so only one request is profiled at a time; its profile also
+        # includes whatever other requests ran on the event loop meanwhile
+        profiler = None
+        if not _profiling_active and random.random() < settings.profiling_sample_rate:
+            _profiling_active = True
+            trace.sampled = True
+            profiler = cProfile.Profile()
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                trace.status = message["status"]
+            await send(message)
+
+        token = current_trace.set(trace)
+        started = time.perf_counter()
+        try:
+            if profiler:
+                profiler.enable()
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if profiler:
+                profiler.disable()
+                _profiling_active = False
+            current_trace.reset(token)
+            trace.duration_ms = (time.perf_counter() - started) * 1000
+            if trace.sampled or trace.duration_ms >= settings.profiling_slow_ms:
+                if profiler:
+                    out = io.StringIO()
+                    pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(PROFILE_LINES)
+                    trace.profile = out.getvalue()
+                traces.append(trace)
@@ -1,4 +1,6 @@
 from .schemas import (
+    BulkImportRequest,
+    BulkImportResponse,
     CheckCreate,
     ChecklistItemCreate,
     ChecklistItemResponse,
@@ -8,13 +10,19 @@ from .schemas import (
     IssueResponse,
     PhotoAnalysisResponse,
     PropertyCreate,
+    PropertyImport,
     PropertyResponse,
     RoomCreate,
+    RoomImport,
     RoomResponse,
     RoomType,
+    UploadSessionCreate,
+    UploadSessionResponse,
 )
 
 __all__ = [
+    "BulkImportRequest",
+    "BulkImportResponse",
     "CheckCreate",
     "ChecklistItemCreate",
     "ChecklistItemResponse",
@@ -24,8 +32,12 @@ __all__ = [
     "IssueResponse",
     "PhotoAnalysisResponse",
     "PropertyCreate",
+    "PropertyImport",
     "PropertyResponse",
     "RoomCreate",
+    "RoomImport",
     "RoomResponse",
     "RoomType",
+    "UploadSessionCreate",
+    "UploadSessionResponse",
 ]
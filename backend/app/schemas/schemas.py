@@ -1,7 +1,7 @@
 from datetime import datetime
 from enum import Enum
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 
 class RoomType(str, Enum):
@@ -86,6 +86,7 @@ class CheckResponse(BaseModel):
 class IssueResponse(BaseModel):
     id: int
     check_id: int
+    room_id: int | None = None
     description: str
     item_name: str | None
     estimated_cost: float
@@ -103,6 +104,24 @@ class PhotoAnalysisResponse(BaseModel):
     issues: list[IssueResponse]
 
 
+# Resumable Uploads
+class UploadSessionCreate(BaseModel):
+    filename: str | None = None
+    size: int = Field(gt=0)
+    sha256: str | None = Field(default=None, pattern="^[0-9a-fA-F]{64}$")
+
+
+class UploadSessionResponse(BaseModel):
+    id: str
+    check_id: int
+    room_id: int
+    size: int
+    offset: int
+
+    class Config:
+        from_attributes = True
+
+
 # Damage Report
 class DamageReportResponse(BaseModel):
     property_name: str
@@ -112,3 +131,23 @@ class DamageReportResponse(BaseModel):
     issues: list[IssueResponse]
     total_estimated_cost: float
     comparison_photos: list[dict]
+
+
+# Bulk Import/Export
+class RoomImport(RoomCreate):
+    items: list[ChecklistItemCreate] = []
+
+
+class PropertyImport(PropertyCreate):
+    rooms: list[RoomImport] = []
+
+
+class BulkImportRequest(BaseModel):
+    properties: list[PropertyImport]
+
+
+class BulkImportResponse(BaseModel):
+    property_ids: list[int]
+    properties_created: int
+    rooms_created: int
+    items_created: int
@@ -1,3 +1,53 @@
-from .vision_service import analyze_room_photo, compare_photos
+from .admission import AdmissionRejected, Priority, admission
+from .bulk_service import BulkImportError, export_csv, export_json, import_properties, parse_csv, parse_json
+from .coalesce_service import KeyedLock, SingleFlight, coalesce, room_locks, single_flight
+from .dedup_service import content_hash, find_duplicate, perceptual_hash
+from .issue_service import apply_room_analysis
+from .retention_service import apply_retention, run_retention
+from .upload_service import (
+    ChunkError,
+    OffsetMismatchError,
+    claim_part,
+    collect_upload_sessions,
+    expire_upload_sessions,
+    parse_content_range,
+    part_path,
+    write_chunk,
+)
+from .vision_service import analyze_room_photo, check_model, compare_photos, keep_model_warm, model_state
 
-__all__ = ["analyze_room_photo", "compare_photos"]
+__all__ = [
+    "AdmissionRejected",
+    "BulkImportError",
+    "ChunkError",
+    "KeyedLock",
+    "OffsetMismatchError",
+    "Priority",
+    "SingleFlight",
+    "admission",
+    "analyze_room_photo",
+    "apply_retention",
+    "apply_room_analysis",
+    "check_model",
+    "claim_part",
+    "coalesce",
+    "collect_upload_sessions",
+    "compare_photos",
+    "content_hash",
+    "expire_upload_sessions",
+    "export_csv",
+    "export_json",
+    "find_duplicate",
+    "import_properties",
+    "keep_model_warm",
+    "model_state",
+    "parse_content_range",
+    "parse_csv",
+    "parse_json",
+    "part_path",
+    "perceptual_hash",
+    "room_locks",
+    "run_retention",
+    "single_flight",
+    "write_chunk",
+]
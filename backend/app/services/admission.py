@@ -0,0 +1,140 @@
+import asyncio
+import enum
+import math
+import time
+from collections import OrderedDict, deque
+from collections.abc import AsyncIterator, Hashable
+from contextlib import asynccontextmanager
+
+from ..config import settings
+
+
+class Priority(enum.IntEnum):
+    """Lower values are admitted first."""
+
+    INTERACTIVE = 0
+    BACKGROUND = 1
+
+
+class AdmissionRejected(Exception):
+    """Raised when the vision queue is full or a waiter times out."""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Vision queue is full, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """Bounded, prioritised wait queue in front of the vision model.
+
+    At most ``max_concurrency`` calls run at once and at most ``max_queue`` callers wait.
+    Waiters are served by priority and, within a priority, round-robin across keys
+    (property ids) so one busy property cannot starve the others.
+    """
+
+    def __init__(self, max_concurrency: int, max_queue: int, queue_timeout: float):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._in_flight = 0
+        self._queued = 0
+        self._waiters: dict[Priority, OrderedDict[Hashable, deque[asyncio.Future]]] = {
+            p: OrderedDict() for p in Priority
+        }
+        self._admitted_total = 0
+        self._rejected_total = 0
+        self._avg_wait = 0.0
+        self._avg_service = 0.0
+
+    @asynccontextmanager
+    async def slot(self, priority: Priority = Priority.INTERACTIVE, key: Hashable = None) -> AsyncIterator[None]:
+        await self._acquire(priority, key)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self._avg_service = _ewma(self._avg_service, time.monotonic() - started)
+            self._release()
+
+    def metrics(self) -> dict:
+        return {
+            "in_flight": self._in_flight,
+            "max_concurrency": self.max_concurrency,
+            "queued": self._queued,
+            "max_queue": self.max_queue,
+            "queued_by_priority": {p.name.lower(): sum(len(w) for w in self._waiters[p].values()) for p in Priority},
+            "queued_properties": len({k for queues in self._waiters.values() for k in queues}),
+            "admitted_total": self._admitted_total,
+            "rejected_total": self._rejected_total,
+            "avg_wait_seconds": round(self._avg_wait, 3),
+            "avg_service_seconds": round(self._avg_service, 3),
+        }
+
+    def retry_after(self) -> int:
+        """Rough number of seconds until the current queue drains."""
+        return max(1, math.ceil(self._avg_service * (self._queued + 1) / max(self.max_concurrency, 1)))
+
+    async def _acquire(self, priority: Priority, key: Hashable) -> None:
+        if self._in_flight < self.max_concurrency and not self._queued:
+            self._in_flight += 1
+            self._admitted_total += 1
+            return
+        if self._queued >= self.max_queue:
+            self._rejected_total += 1
+            raise AdmissionRejected(self.retry_after())
+
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters[priority].setdefault(key, deque()).append(fut)
+        self._queued += 1
+        queued_at = time.monotonic()
+        try:
+            async with asyncio.timeout(self.queue_timeout):
+                await fut
+        except BaseException as e:
+            if fut.done() and not fut.cancelled():
+                # The slot was handed to us just as we gave up; pass it on
+                self._release()
+            else:
+                fut.cancel()
+                self._remove(priority, key, fut)
+            if isinstance(e, TimeoutError):
+                self._rejected_total += 1
+                raise AdmissionRejected(self.retry_after()) from None
+            raise
+        self._admitted_total += 1
+        self._avg_wait = _ewma(self._avg_wait, time.monotonic() - queued_at)
+
+    def _remove(self, priority: Priority, key: Hashable, fut: asyncio.Future) -> None:
+        queues = self._waiters[priority]
+        queues[key].remove(fut)
+        if not queues[key]:
+            del queues[key]
+        self._queued -= 1
+
+    def _release(self) -> None:
+        for priority in Priority:
+            queues = self._waiters[priority]
+            if not queues:
+                continue
+            key, waiters = next(iter(queues.items()))
+            fut = waiters.popleft()
+            if waiters:
+                queues.move_to_end(key)
+            else:
+                del queues[key]
+            self._queued -= 1
+            # Hand the slot straight to the waiter; in_flight is unchanged
+            fut.set_result(None)
+            return
+        self._in_flight -= 1
+
+
+def _ewma(current: float, sample: float, alpha: float = 0.2) -> float:
+    return sample if current == 0 else current + alpha * (sample - current)
+
+
+admission = AdmissionController(
+    max_concurrency=settings.vision_max_concurrency,
+    max_queue=settings.vision_max_queue,
+    queue_timeout=settings.vision_queue_timeout,
+)
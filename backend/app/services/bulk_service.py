@@ -0,0 +1,209 @@
+import csv
+import io
+import json
+from collections.abc import AsyncIterator
+from typing import TypedDict
+
+from pydantic import ValidationError
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..models import ChecklistItem, Property, Room
+from ..schemas import PropertyImport
+
+CSV_COLUMNS = ["property_name", "property_address", "room_name", "room_type", "item_name", "replacement_cost"]
+
+
+class BulkImportError(ValueError):
+    """Raised when an import file cannot be parsed into a property tree."""
+
+
+class BulkImportResult(TypedDict):
+    property_ids: list[int]
+    properties_created: int
+    rooms_created: int
+    items_created: int
+
+
+def parse_csv(text: str) -> list[PropertyImport]:
+    """Build property trees from flat CSV rows, one row per checklist item.
+
+    Rows are grouped by (property_name, property_address) and then room_name. A row
+    with an empty item_name declares a room without adding an item to it.
+    """
+
+    reader = csv.DictReader(io.StringIO(text))
+    missing = [c for c in ("property_name", "room_name") if c not in (reader.fieldnames or [])]
+    if missing:
+        raise BulkImportError(f"Missing CSV columns: {', '.join(missing)}")
+
+    properties: dict[tuple[str, str], dict] = {}
+    rooms: dict[tuple[str, str, str], dict] = {}
+    for line, row in enumerate(reader, start=2):
+        # Short rows leave trailing columns as None
+        prop_key = ((row.get("property_name") or "").strip(), (row.get("property_address") or "").strip())
+        if not prop_key[0]:
+            raise BulkImportError(f"Line {line}: property_name is required")
+        prop = properties.setdefault(prop_key, {"name": prop_key[0], "address": prop_key[1] or None, "rooms": []})
+
+        room_name = (row.get("room_name") or "").strip()
+        if not room_name:
+            continue
+        room_key = (*prop_key, room_name)
+        if room_key not in rooms:
+            rooms[room_key] = {"name": room_name, "items": []}
+            if room_type := (row.get("room_type") or "").strip():
+                rooms[room_key]["room_type"] = room_type
+            prop["rooms"].append(rooms[room_key])
+
+        if item_name := (row.get("item_name") or "").strip():
+            item: dict = {"name": item_name}
+            if cost := (row.get("replacement_cost") or "").strip():
+                item["replacement_cost"] = cost
+            rooms[room_key]["items"].append(item)
+
+    try:
+        return [PropertyImport.model_validate(p) for p in properties.values()]
+    except ValidationError as e:
+        raise BulkImportError(str(e)) from e
+
+
+def parse_json(text: str) -> list[PropertyImport]:
+    """Parse either a bare list of properties or an export document ({"properties": [...]})."""
+
+    try:
+        data = json.loads(text)
+        if isinstance(data, dict):
+            data = data.get("properties", [])
+        return [PropertyImport.model_validate(p) for p in data]
+    except (json.JSONDecodeError, TypeError, ValidationError) as e:
+        raise BulkImportError(str(e)) from e
+
+
+async def import_properties(db: AsyncSession, properties: list[PropertyImport]) -> BulkImportResult:
+    """Insert whole property trees with one bulk INSERT per table, in a single transaction."""
+
+    try:
+        property_ids = (
+            (
+                await db.scalars(
+                    insert(Property).returning(Property.id, sort_by_parameter_order=True),
+                    [p.model_dump(exclude={"rooms"}) for p in properties],
+                )
+            ).all()
+            if properties
+            else []
+        )
+
+        room_rows = [
+            (room, {"property_id": prop_id, **room.model_dump(exclude={"items"})})
+            for prop, prop_id in zip(properties, property_ids, strict=True)
+            for room in prop.rooms
+        ]
+        room_ids = (
+            (
+                await db.scalars(
+                    insert(Room).returning(Room.id, sort_by_parameter_order=True),
+                    [values for _, values in room_rows],
+                )
+            ).all()
+            if room_rows
+            else []
+        )
+
+        item_rows = [
+            {"room_id": room_id, **item.model_dump()}
+            for (room, _), room_id in zip(room_rows, room_ids, strict=True)
+            for item in room.items
+        ]
+        if item_rows:
+            await db.execute(insert(ChecklistItem), item_rows)
+
+        await db.commit()
+    except Exception:
+        await db.rollback()
+        raise
+
+    return {
+        "property_ids": list(property_ids),
+        "properties_created": len(property_ids),
+        "rooms_created": len(room_ids),
+        "items_created": len(item_rows),
+    }
+
+
+async def _export_rows(db: AsyncSession, property_id: int | None = None) -> AsyncIterator[dict]:
+    query = (
+        select(
+            Property.id.label("property_id"),
+            Property.name.label("property_name"),
+            Property.address.label("property_address"),
+            Room.id.label("room_id"),
+            Room.name.label("room_name"),
+            Room.room_type,
+            ChecklistItem.name.label("item_name"),
+            ChecklistItem.replacement_cost,
+        )
+        .outerjoin(Room, Room.property_id == Property.id)
+        .outerjoin(ChecklistItem, ChecklistItem.room_id == Room.id)
+        .order_by(Property.id, Room.id, ChecklistItem.id)
+    )
+    if property_id is not None:
+        query = query.where(Property.id == property_id)
+
+    result = await db.stream(query)
+    try:
+        async for row in result.mappings():
+            yield dict(row)
+    finally:
+        await result.close()
+
+
+async def export_csv(db: AsyncSession, property_id: int | None = None) -> AsyncIterator[str]:
+    """Stream the property tree as CSV in the same layout accepted by parse_csv."""
+
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=CSV_COLUMNS, extrasaction="ignore")
+    writer.writeheader()
+    async for row in _export_rows(db, property_id):
+        writer.writerow(
+            {
+                **row,
+                "room_name": row["room_name"] or "",
+                "room_type": row["room_type"].value if row["room_type"] else "",
+                "replacement_cost": "" if row["item_name"] is None else row["replacement_cost"],
+            }
+        )
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+async def export_json(db: AsyncSession, property_id: int | None = None) -> AsyncIterator[str]:
+    """Stream the property tree as a JSON document, one property at a time."""
+
+    yield '{"properties": ['
+    current: dict | None = None
+    current_id = room_id = None
+    first = True
+    async for row in _export_rows(db, property_id):
+        if row["property_id"] != current_id:
+            if current is not None:
+                yield ("" if first else ", ") + json.dumps(current)
+                first = False
+            current_id = row["property_id"]
+            current = {"name": row["property_name"], "address": row["property_address"], "rooms": []}
+        if row["room_id"] is None:
+            continue
+        if row["room_id"] != room_id:
+            room_id = row["room_id"]
+            current["rooms"].append({"name": row["room_name"], "room_type": row["room_type"].value, "items": []})
+        if row["item_name"] is not None:
+            current["rooms"][-1]["items"].append(
+                {"name": row["item_name"], "replacement_cost": row["replacement_cost"]}
+            )
+    if current is not None:
+        yield ("" if first else ", ") + json.dumps(current)
+    yield "]}"
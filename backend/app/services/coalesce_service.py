@@ -0,0 +1,168 @@
+import asyncio
+import json
+import uuid
+from collections.abc import AsyncIterator, Awaitable, Callable, Hashable
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from functools import partial
+from typing import Any, TypeVar
+
+from pydantic_core import to_jsonable_python
+from sqlalchemy import delete, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..config import settings
+from ..database import async_session
+from ..models import Lease
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """Share one in-flight computation between concurrent callers with the same key.
+
+    The computation runs as its own task, so a caller that is cancelled (e.g. a client
+    disconnecting) doesn't cancel it for everyone else waiting on the result.
+    """
+
+    def __init__(self) -> None:
+        self._calls: dict[Hashable, asyncio.Task] = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+        return await asyncio.shield(task)
+
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+
+class KeyedLock:
+    """One lock per key within this process, e.g. to make a check-then-insert on a room's rows atomic.
+
+    A key's lock is dropped once nobody holds or waits on it, so keys don't accumulate.
+    """
+
+    def __init__(self) -> None:
+        self._locks: dict[Hashable, asyncio.Lock] = {}
+        self._users: dict[Hashable, int] = {}
+
+    @asynccontextmanager
+    async def hold(self, key: Hashable) -> AsyncIterator[None]:
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        self._users[key] = self._users.get(key, 0) + 1
+        try:
+            async with lock:
+                yield
+        finally:
+            self._users[key] -= 1
+            if not self._users[key]:
+                del self._users[key], self._locks[key]
+
+    def __len__(self) -> int:
+        return len(self._locks)
+
+
+async def _try_acquire(
+    db: AsyncSession, key: str, owner: str, now: datetime, ttl: float, take_finished: bool = False
+) -> bool:
+    # A single upsert that only takes over expired (or, if asked, finished) leases, so the write lock
+    # is held for one statement; a delete-then-insert transaction can deadlock with other replicas on SQLite
+    takeover = Lease.expires_at < now
+    if take_finished:
+        takeover |= Lease.result.is_not(None)
+    stmt = (
+        sqlite_insert(Lease)
+        .values(key=key, owner=owner, expires_at=now + timedelta(seconds=ttl))
+        .on_conflict_do_update(
+            index_elements=[Lease.key],
+            set_={"owner": owner, "expires_at": now + timedelta(seconds=ttl), "result": None},
+            where=takeover,
+        )
+        .returning(Lease.owner)
+    )
+    acquired = (await db.execute(stmt)).scalar_one_or_none() == owner
+    await db.commit()
+    return acquired
+
+
+async def run_with_lease(db: AsyncSession, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+    """Run ``fn`` on at most one replica at a time, sharing its JSON result with the others.
+
+    The replica that inserts the lease row computes the result and stores it on the row for
+    ``coalesce_result_ttl`` seconds; other replicas poll the row until the result appears, or
+    take over once the lease expires if its owner died. Only callers that were already waiting
+    get the stored result: a new caller takes over a finished row and computes a fresh one.
+    """
+
+    owner = str(uuid.uuid4())
+    take_finished = True
+    while not await _try_acquire(db, key, owner, datetime.utcnow(), settings.coalesce_lease_ttl, take_finished):
+        # From here on this caller waits on a computation that was in flight when it arrived
+        take_finished = False
+        row = (await db.execute(select(Lease.result).where(Lease.key == key))).one_or_none()
+        await db.commit()
+        if row and row.result is not None:
+            return json.loads(row.result)
+        await asyncio.sleep(settings.coalesce_poll_interval)
+
+    try:
+        result = to_jsonable_python(await fn())
+    except BaseException:
+        await db.rollback()
+        await db.execute(delete(Lease).where(Lease.key == key, Lease.owner == owner))
+        await db.commit()
+        raise
+
+    now = datetime.utcnow()
+    await db.execute(
+        update(Lease)
+        .where(Lease.key == key, Lease.owner == owner)
+        .values(result=json.dumps(result), expires_at=now + timedelta(seconds=settings.coalesce_result_ttl))
+    )
+    # Results past their TTL have no waiters left; drop them rather than keep every report ever built
+    await db.execute(delete(Lease).where(Lease.result.is_not(None), Lease.expires_at < now))
+    await db.commit()
+    return result
+
+
+async def run_once_per(db: AsyncSession, key: str, period: float, fn: Callable[[], Awaitable[T]]) -> T | None:
+    """Run ``fn`` at most once per ``period`` seconds across all processes sharing the database.
+
+    Used for periodic maintenance so that with several workers only one of them does the work.
+    Returns None without running ``fn`` if another process already ran it this period.
+    """
+
+    owner = str(uuid.uuid4())
+    if not await _try_acquire(db, key, owner, datetime.utcnow(), period):
+        return None
+    try:
+        return await fn()
+    except BaseException:
+        # Let another process retry instead of waiting out the period
+        await db.rollback()
+        await db.execute(delete(Lease).where(Lease.key == key, Lease.owner == owner))
+        await db.commit()
+        raise
+
+
+single_flight = SingleFlight()
+room_locks = KeyedLock()
+
+
+async def coalesce(key: str, fn: Callable[[AsyncSession], Awaitable[Any]]) -> Any:
+    """Coalesce identical requests within this process and, via a DB lease, across replicas.
+
+    The shared computation gets its own session rather than borrowing the first caller's,
+    which is closed when that caller's request ends even though others still wait on it.
+    """
+
+    async def run() -> Any:
+        async with async_session() as db:
+            return await run_with_lease(db, key, partial(fn, db))
+
+    return await single_flight.do(key, run)
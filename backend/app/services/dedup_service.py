@@ -0,0 +1,61 @@
+import hashlib
+import io
+from collections.abc import Iterable
+
+from PIL import Image, UnidentifiedImageError
+
+from ..models import Photo
+
+HASH_SIZE = 8
+
+
+def content_hash(data: bytes) -> str:
+    """SHA-256 of the raw upload, used to detect byte-identical photos."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def perceptual_hash(data: bytes) -> str | None:
+    """64-bit difference hash (dHash) of an image as 16 hex chars, or None if it can't be decoded.
+
+    Near-identical frames (burst shots, re-encodes, slight exposure changes) hash to values a
+    few bits apart, unlike content_hash which changes completely on any byte difference.
+    """
+
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            # Let the JPEG decoder downscale while decoding instead of decoding full resolution
+            img.draft("L", (HASH_SIZE * 8, HASH_SIZE * 8))
+            pixels = list(img.convert("L").resize((HASH_SIZE + 1, HASH_SIZE), Image.Resampling.LANCZOS).getdata())
+    except (UnidentifiedImageError, OSError):
+        return None
+
+    bits = 0
+    for row in range(HASH_SIZE):
+        for col in range(HASH_SIZE):
+            left = pixels[row * (HASH_SIZE + 1) + col]
+            right = pixels[row * (HASH_SIZE + 1) + col + 1]
+            bits = (bits << 1) | (left > right)
+    return f"{bits:0{HASH_SIZE * HASH_SIZE // 4}x}"
+
+
+def hamming_distance(a: str, b: str) -> int:
+    return (int(a, 16) ^ int(b, 16)).bit_count()
+
+
+def find_duplicate(candidates: Iterable[Photo], sha256: str, phash: str | None, threshold: int) -> Photo | None:
+    """Return the closest existing photo that is an exact or near duplicate of the upload.
+
+    Exact content matches win; otherwise the photo with the smallest perceptual distance
+    within ``threshold`` bits is returned.
+    """
+
+    best: Photo | None = None
+    best_distance = threshold + 1
+    for photo in candidates:
+        if photo.content_hash == sha256:
+            return photo
+        if phash and photo.perceptual_hash:
+            distance = hamming_distance(phash, photo.perceptual_hash)
+            if distance < best_distance:
+                best, best_distance = photo, distance
+    return best
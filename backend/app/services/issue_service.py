@@ -0,0 +1,94 @@
+import ast
+import re
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..models import Issue, Photo
+from .vision_service import FALLBACK_ANALYSIS, RoomAnalysisResult
+
+MISSING_PREFIX = "Missing: "
+DAMAGE_SIMILARITY = 0.5
+
+_STOPWORDS = {"a", "an", "the", "on", "in", "of", "to", "with", "and", "is", "are", "there", "some", "near", "at"}
+
+
+def _tokens(description: str) -> set[str]:
+    return {w for w in re.findall(r"[a-z0-9]+", description.lower()) if w not in _STOPWORDS}
+
+
+def is_similar_damage(a: str, b: str) -> bool:
+    """Whether two damage descriptions likely describe the same damage.
+
+    One description's words must all appear in the other, so a differing word ("left" vs "right
+    nightstand") keeps them apart, and they must share enough of their words (Jaccard similarity).
+    """
+    ta, tb = _tokens(a), _tokens(b)
+    if not ta or not tb:
+        return a.strip().lower() == b.strip().lower()
+    if not (ta <= tb or tb <= ta):
+        return False
+    return len(ta & tb) / len(ta | tb) >= DAMAGE_SIMILARITY
+
+
+async def apply_room_analysis(
+    db: AsyncSession,
+    check_id: int,
+    room_id: int,
+    analysis: RoomAnalysisResult,
+    item_costs: dict[str, float],
+) -> tuple[list[Issue], list[Issue]]:
+    """Merge one photo's analysis into the consolidated issues for a room in a check.
+
+    An item is reported missing only while every analysis of the room's photos in the check
+    lists it, so a later photo that sees the item resolves the issue. Analyses the model
+    couldn't produce say nothing about the room and are ignored. Damage descriptions similar
+    to an existing issue are treated as the same damage. Returns the (created, resolved)
+    issues; nothing is committed.
+    """
+
+    result = await db.execute(select(Issue).where(Issue.check_id == check_id, Issue.room_id == room_id))
+    existing = result.scalars().all()
+    missing_issues = {i.item_name: i for i in existing if i.item_name and i.description.startswith(MISSING_PREFIX)}
+    damage_issues = [i for i in existing if not i.item_name]
+
+    created: list[Issue] = []
+    resolved: list[Issue] = []
+
+    # Duplicates share their original's analysis, so they add nothing to the intersection
+    stored = await db.execute(
+        select(Photo.analysis_result).where(
+            Photo.check_id == check_id, Photo.room_id == room_id, Photo.duplicate_of_id.is_(None)
+        )
+    )
+    analyses = [ast.literal_eval(a) for a in stored.scalars() if a] + [analysis]
+    missing_lists = [a.get("missing_items", []) for a in analyses if a != FALLBACK_ANALYSIS]
+    missing_now = set.intersection(*map(set, missing_lists)) if missing_lists else set()
+
+    for item_name, issue in missing_issues.items():
+        if item_name not in missing_now:
+            await db.delete(issue)
+            resolved.append(issue)
+    for missing in dict.fromkeys(missing_lists[0] if missing_lists else []):
+        if missing not in missing_now or missing in missing_issues:
+            continue
+        issue = Issue(
+            check_id=check_id,
+            room_id=room_id,
+            description=f"{MISSING_PREFIX}{missing}",
+            item_name=missing,
+            estimated_cost=item_costs.get(missing, 0),
+            severity="medium",
+        )
+        db.add(issue)
+        created.append(issue)
+
+    for damage in analysis.get("damage_detected", []):
+        if any(is_similar_damage(damage, i.description) for i in damage_issues):
+            continue
+        issue = Issue(check_id=check_id, room_id=room_id, description=damage, severity="high")
+        db.add(issue)
+        damage_issues.append(issue)
+        created.append(issue)
+
+    return created, resolved
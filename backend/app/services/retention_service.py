@@ -0,0 +1,179 @@
+import asyncio
+import io
+import logging
+import os
+import shutil
+from datetime import datetime, timedelta
+from functools import partial
+from typing import TypedDict
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+from sqlalchemy import exists, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+
+from ..config import settings
+from ..database import async_session
+from ..models import Check, Photo
+from .coalesce_service import run_once_per
+
+logger = logging.getLogger(__name__)
+
+# Files younger than this may belong to an upload whose Photo row isn't committed yet
+ORPHAN_GRACE = timedelta(hours=1)
+
+
+class RetentionReport(TypedDict):
+    dry_run: bool
+    recompressed: int
+    recompressed_bytes_saved: int
+    archived: int
+    archived_bytes: int
+    orphans_deleted: int
+    orphan_bytes_reclaimed: int
+    bytes_reclaimed: int
+
+
+def recompress_file(path: str, quality: int, max_dimension: int) -> tuple[str, int] | None:
+    """Re-encode an image as a downscaled JPEG, returning (new_path, bytes_saved) if that made it smaller.
+
+    A non-JPEG original is written to a new ``.jpg`` path and left in place; the caller removes it
+    once nothing refers to it any more.
+    """
+
+    old_size = os.path.getsize(path)
+    try:
+        with Image.open(path) as img:
+            img = ImageOps.exif_transpose(img).convert("RGB")
+            img.thumbnail((max_dimension, max_dimension))
+            buffer = io.BytesIO()
+            img.save(buffer, "JPEG", quality=quality, optimize=True)
+    except (UnidentifiedImageError, OSError):
+        return None
+    if buffer.tell() >= old_size:
+        return None
+
+    root, ext = os.path.splitext(path)
+    new_path = path if ext.lower() in (".jpg", ".jpeg") else f"{root}.jpg"
+    tmp_path = f"{new_path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(buffer.getvalue())
+    os.replace(tmp_path, new_path)
+    return new_path, old_size - buffer.tell()
+
+
+def _in_archive(path: str) -> bool:
+    return os.path.dirname(os.path.abspath(path)) == os.path.abspath(settings.archive_dir)
+
+
+async def _recompress(db: AsyncSession, now: datetime, dry_run: bool, report: RetentionReport) -> None:
+    cutoff = now - timedelta(days=settings.photo_recompress_after_days)
+    result = await db.execute(
+        select(Photo.file_path).distinct().where(Photo.created_at < cutoff, Photo.recompressed_at.is_(None))
+    )
+    for path in result.scalars().all():
+        if not os.path.exists(path):
+            continue
+        if dry_run:
+            report["recompressed"] += 1
+            continue
+        outcome = await asyncio.to_thread(
+            recompress_file, path, settings.photo_recompress_quality, settings.photo_max_dimension
+        )
+        new_path, saved = outcome or (path, 0)
+        # Photos that couldn't be shrunk are marked too, so they aren't retried every run
+        await db.execute(update(Photo).where(Photo.file_path == path).values(file_path=new_path, recompressed_at=now))
+        # Committed per file, and the original removed only afterwards, so an interrupted run
+        # never leaves a row pointing at a deleted file
+        await db.commit()
+        if new_path != path:
+            os.remove(path)
+        if outcome:
+            report["recompressed"] += 1
+            report["recompressed_bytes_saved"] += saved
+
+
+async def _archive(db: AsyncSession, now: datetime, dry_run: bool, report: RetentionReport) -> None:
+    # A check is closed once the property has a newer check of the same type (the next stay has started)
+    cutoff = now - timedelta(days=settings.photo_archive_after_days)
+    newer = aliased(Check)
+    closed = select(Check.id).where(
+        Check.created_at < cutoff,
+        exists().where(
+            newer.property_id == Check.property_id,
+            newer.check_type == Check.check_type,
+            newer.created_at > Check.created_at,
+        ),
+    )
+    result = await db.execute(select(Photo.file_path).distinct().where(Photo.check_id.in_(closed)))
+    paths = [p for p in result.scalars().all() if not _in_archive(p) and os.path.exists(p)]
+
+    if paths and not dry_run:
+        os.makedirs(settings.archive_dir, exist_ok=True)
+    for path in paths:
+        size = os.path.getsize(path)
+        if not dry_run:
+            new_path = os.path.join(settings.archive_dir, os.path.basename(path))
+            await asyncio.to_thread(shutil.move, path, new_path)
+            await db.execute(update(Photo).where(Photo.file_path == path).values(file_path=new_path))
+            await db.commit()
+        report["archived"] += 1
+        report["archived_bytes"] += size
+
+
+async def _delete_orphans(db: AsyncSession, now: datetime, dry_run: bool, report: RetentionReport) -> None:
+    result = await db.execute(select(Photo.file_path))
+    referenced = {os.path.abspath(p) for p in result.scalars().all()}
+    grace_cutoff = (now - ORPHAN_GRACE).timestamp()
+
+    for directory in (settings.upload_dir, settings.archive_dir):
+        if not os.path.isdir(directory):
+            continue
+        for entry in os.scandir(directory):
+            if not entry.is_file() or os.path.abspath(entry.path) in referenced:
+                continue
+            stat = entry.stat()
+            if stat.st_mtime > grace_cutoff:
+                continue
+            if not dry_run:
+                os.remove(entry.path)
+            report["orphans_deleted"] += 1
+            report["orphan_bytes_reclaimed"] += stat.st_size
+
+
+async def apply_retention(db: AsyncSession, dry_run: bool = False, now: datetime | None = None) -> RetentionReport:
+    """Recompress old photos, archive photos of closed checks and delete files no Photo row refers to."""
+
+    now = now or datetime.utcnow()
+    report: RetentionReport = {
+        "dry_run": dry_run,
+        "recompressed": 0,
+        "recompressed_bytes_saved": 0,
+        "archived": 0,
+        "archived_bytes": 0,
+        "orphans_deleted": 0,
+        "orphan_bytes_reclaimed": 0,
+        "bytes_reclaimed": 0,
+    }
+    await _recompress(db, now, dry_run, report)
+    await _archive(db, now, dry_run, report)
+    await _delete_orphans(db, now, dry_run, report)
+    report["bytes_reclaimed"] = report["recompressed_bytes_saved"] + report["orphan_bytes_reclaimed"]
+    return report
+
+
+async def run_retention(interval: float) -> None:
+    """Periodically apply the photo retention policy."""
+
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            async with async_session() as db:
+                # With several workers only one applies the policy each interval
+                report = await run_once_per(db, "retention", interval * 0.9, partial(apply_retention, db))
+        except Exception:
+            # A bad file or a locked database shouldn't stop retention for the rest of the process's life
+            logger.exception("Photo retention failed")
+            continue
+        if report:
+            logger.info("Photo retention reclaimed %d bytes: %s", report["bytes_reclaimed"], report)
@@ -0,0 +1,125 @@
+import asyncio
+import logging
+import os
+import re
+from collections.abc import AsyncIterator
+from datetime import datetime, timedelta
+from functools import partial
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..config import settings
+from ..database import async_session
+from ..models import UploadSession
+from .coalesce_service import run_once_per
+
+logger = logging.getLogger(__name__)
+
+PARTIAL_DIR = ".partial"
+
+_CONTENT_RANGE = re.compile(r"^bytes (\d+)-(\d+)/(\d+)$")
+
+
+class ChunkError(ValueError):
+    """Raised when a chunk or its Content-Range is malformed."""
+
+
+class OffsetMismatchError(ChunkError):
+    """Raised when a chunk does not start where the server's copy ends."""
+
+
+def part_path(upload_id: str) -> str:
+    return os.path.join(settings.upload_dir, PARTIAL_DIR, f"{upload_id}.part")
+
+
+def claim_part(upload_id: str) -> str | None:
+    """Atomically take an upload's assembled file for finalizing, returning its new path.
+
+    Returns None if the file is gone, i.e. another request (in any worker) is finalizing it.
+    """
+
+    claimed = os.path.join(settings.upload_dir, PARTIAL_DIR, f"{upload_id}.finalizing")
+    try:
+        os.replace(part_path(upload_id), claimed)
+    except FileNotFoundError:
+        return None
+    return claimed
+
+
+def parse_content_range(header: str | None, size: int) -> tuple[int, int]:
+    """Parse ``Content-Range: bytes start-end/total`` into a half-open (start, end) byte range."""
+
+    match = _CONTENT_RANGE.match(header or "")
+    if not match:
+        raise ChunkError("Content-Range must look like 'bytes start-end/total'")
+    start, last, total = (int(g) for g in match.groups())
+    if total != size or start > last or last >= size:
+        raise ChunkError(f"Content-Range {header!r} does not fit an upload of {size} bytes")
+    return start, last + 1
+
+
+async def write_chunk(upload: UploadSession, start: int, end: int, body: AsyncIterator[bytes]) -> int:
+    """Write a chunk at ``start`` and return the new offset.
+
+    Bytes that arrived before a dropped connection are kept, so the client can resume from
+    the returned offset rather than resending the whole chunk.
+    """
+
+    if start != upload.offset:
+        raise OffsetMismatchError(f"Expected chunk starting at {upload.offset}")
+
+    path = part_path(upload.id)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    written = 0
+    with open(path, "r+b" if os.path.exists(path) else "wb") as f:
+        f.seek(start)
+        f.truncate()
+        try:
+            async for data in body:
+                if written + len(data) > end - start:
+                    raise ChunkError("Chunk is longer than its Content-Range")
+                f.write(data)
+                written += len(data)
+        finally:
+            f.flush()
+            f.truncate(start + written)
+    return start + written
+
+
+async def expire_upload_sessions(db: AsyncSession, ttl: float) -> int:
+    """Delete sessions idle for longer than ``ttl`` seconds and any partial files without a session."""
+
+    cutoff = datetime.utcnow() - timedelta(seconds=ttl)
+    result = await db.execute(select(UploadSession))
+    sessions = result.scalars().all()
+
+    expired = [s for s in sessions if (s.updated_at or s.created_at) < cutoff]
+    for upload in expired:
+        await db.delete(upload)
+    await db.commit()
+
+    # Files are only removed once they are also past the TTL, so a session created meanwhile keeps its file
+    live = {f"{s.id}.{suffix}" for s in sessions if s not in expired for suffix in ("part", "finalizing")}
+    partial_dir = os.path.join(settings.upload_dir, PARTIAL_DIR)
+    if os.path.isdir(partial_dir):
+        for entry in os.scandir(partial_dir):
+            if entry.name not in live and datetime.utcfromtimestamp(entry.stat().st_mtime) < cutoff:
+                os.remove(entry.path)
+    return len(expired)
+
+
+async def collect_upload_sessions(interval: float, ttl: float) -> None:
+    """Periodically garbage-collect abandoned upload sessions."""
+
+    while True:
+        try:
+            async with async_session() as db:
+                # The lease is a bit shorter than the interval so the next tick on any worker can take it
+                expired = await run_once_per(db, "upload-gc", interval * 0.9, partial(expire_upload_sessions, db, ttl))
+        except Exception:
+            logger.exception("Upload session cleanup failed")
+        else:
+            if expired:
+                logger.info("Expired %d abandoned upload sessions", expired)
+        await asyncio.sleep(interval)
@@ -1,12 +1,63 @@
+import asyncio
 import base64
 import json
-from typing import Literal, TypedDict
-
-import ollama
+import logging
+from datetime import datetime
+from typing import TYPE_CHECKING, Literal, TypedDict
 
 from ..config import settings
+from ..profiling import vision_call
+
+if TYPE_CHECKING:
+    import ollama
+
+logger = logging.getLogger(__name__)
+
+# Built on first use: importing ollama and opening its HTTP client is a noticeable part of startup
+client: "ollama.AsyncClient | None" = None
+
+
+def get_client() -> "ollama.AsyncClient":
+    global client
+    if client is None:
+        import ollama
+
+        client = ollama.AsyncClient(host=settings.ollama_host)
+    return client
+
+
+def _ollama_errors() -> tuple[type[BaseException], ...]:
+    import ollama
+
+    # The client turns a refused connection into ConnectionError, an OSError
+    return (ollama.ResponseError, OSError)
+
+
+class ModelState:
+    """Last known state of the Ollama server and the configured model."""
+
+    def __init__(self) -> None:
+        self.reachable = False
+        self.loaded = False
+        self.last_error: str | None = None
+        self.last_checked: datetime | None = None
+
+    @property
+    def ready(self) -> bool:
+        return self.reachable and (self.loaded or not settings.ollama_preload)
+
+    def as_dict(self) -> dict:
+        return {
+            "ready": self.ready,
+            "reachable": self.reachable,
+            "model": settings.ollama_model,
+            "loaded": self.loaded,
+            "last_error": self.last_error,
+            "last_checked": self.last_checked,
+        }
 
-client: ollama.AsyncClient = ollama.AsyncClient(host=settings.ollama_host)
+
+model_state = ModelState()
 
 
 class RoomAnalysisResult(TypedDict):
@@ -16,6 +67,15 @@ class RoomAnalysisResult(TypedDict):
     condition_score: int
 
 
+# Returned when the model's reply can't be parsed; it says nothing about the room
+FALLBACK_ANALYSIS: RoomAnalysisResult = {
+    "missing_items": [],
+    "damage_detected": [],
+    "cleanliness_issues": [],
+    "condition_score": 5,
+}
+
+
 class PhotoComparisonResult(TypedDict):
     new_damage: list[str]
     missing_items: list[str]
@@ -24,6 +84,57 @@ class PhotoComparisonResult(TypedDict):
     estimated_damage_cost: float
 
 
+def _is_configured_model(name: str) -> bool:
+    model = settings.ollama_model
+    return name == model or (":" not in model and name.split(":")[0] == model)
+
+
+async def check_model() -> None:
+    """Ping Ollama and record whether the configured model is currently loaded in memory."""
+
+    model_state.last_checked = datetime.utcnow()
+    try:
+        running = await get_client().ps()
+    except _ollama_errors() as e:
+        model_state.reachable = model_state.loaded = False
+        model_state.last_error = str(e)
+        return
+    model_state.reachable = True
+    model_state.loaded = any(_is_configured_model(m.model or m.name or "") for m in running.models)
+    model_state.last_error = None
+
+
+async def preload_model() -> None:
+    """Load the configured model into memory; an empty prompt makes Ollama load it without generating."""
+
+    try:
+        await get_client().generate(model=settings.ollama_model, prompt="", keep_alive=settings.ollama_keep_alive)
+    except _ollama_errors() as e:
+        model_state.loaded = False
+        model_state.last_error = str(e)
+        logger.warning("Failed to preload %s: %s", settings.ollama_model, e)
+        return
+    model_state.reachable = model_state.loaded = True
+    model_state.last_error = None
+
+
+async def keep_model_warm(interval: float) -> None:
+    """Periodically refresh the model's keep-alive (when preloading) and record whether it is loaded.
+
+    Ollama only restarts its keep-alive timer on a request, so the preload request is sent every
+    tick rather than only once the model was evicted; ``ps`` is just for the readiness status.
+    """
+
+    while True:
+        try:
+            if settings.ollama_preload:
+                await preload_model()
+            await check_model()
+        except Exception:
+            logger.exception("Failed to keep %s warm", settings.ollama_model)
+        await asyncio.sleep(interval)
+
+
 async def analyze_room_photo(image_path: str, checklist_items: list[str], room_name: str) -> RoomAnalysisResult:
     """Analyze a room photo using Ollama vision model to detect missing items and damage."""
 
@@ -50,16 +161,19 @@ Respond in JSON format only, no markdown or explanation:
     "condition_score": 1-10
 }}"""
 
-    response = await client.chat(  # type: ignore[attr-defined]
-        model=settings.ollama_model,
-        messages=[
-            {
-                "role": "user",
-                "content": prompt,
-                "images": [image_data],
-            }
-        ],
-    )
+    with vision_call("analyze_room_photo"):
+        response = await get_client().chat(  # type: ignore[attr-defined]
+            model=settings.ollama_model,
+            messages=[
+                {
+                    "role": "user",
+                    "content": prompt,
+                    "images": [image_data],
+                }
+            ],
+            keep_alive=settings.ollama_keep_alive,
+        )
+    model_state.loaded = True
 
     try:
         text = response["message"]["content"].strip()
@@ -67,7 +181,7 @@ Respond in JSON format only, no markdown or explanation:
             text = text.split("\n", 1)[1].rsplit("```", 1)[0]
         return json.loads(text)
     except (json.JSONDecodeError, KeyError, IndexError):
-        return {"missing_items": [], "damage_detected": [], "cleanliness_issues": [], "condition_score": 5}
+        return dict(FALLBACK_ANALYSIS)  # type: ignore[return-value]
 
 
 async def compare_photos(before_path: str, after_path: str, room_name: str) -> PhotoComparisonResult:
@@ -98,16 +212,19 @@ Respond in JSON format only, no markdown or explanation:
     "estimated_damage_cost": 0.00
 }}"""
 
-    response = await client.chat(  # type: ignore[attr-defined]
-        model=settings.ollama_model,
-        messages=[
-            {
-                "role": "user",
-                "content": prompt,
-                "images": [before_data, after_data],
-            }
-        ],
-    )
+    with vision_call("compare_photos"):
+        response = await get_client().chat(  # type: ignore[attr-defined]
+            model=settings.ollama_model,
+            messages=[
+                {
+                    "role": "user",
+                    "content": prompt,
+                    "images": [before_data, after_data],
+                }
+            ],
+            keep_alive=settings.ollama_keep_alive,
+        )
+    model_state.loaded = True
 
     try:
         text = response["message"]["content"].strip()
@@ -1,8 +1,15 @@
+import asyncio
+import io
+from types import SimpleNamespace
+
 import pytest
 from httpx import ASGITransport, AsyncClient
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from PIL import Image, ImageDraw
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
 
+from app import database
+from app.api import routes
 from app.database import Base, get_db
 from app.main import app
 
@@ -26,8 +33,20 @@ async def db_session(async_engine):
 
 
 @pytest.fixture
-async def client(async_engine):
+async def file_sessions(tmp_path):
+    """Sessions on a database file, so that each one gets its own connection like separate workers would."""
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'shared.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    yield async_sessionmaker(engine, expire_on_commit=False)
+    await engine.dispose()
+
+
+@pytest.fixture
+async def client(async_engine, monkeypatch):
     """Create a test client with overridden database."""
+    # Work that opens its own session instead of using get_db goes to the test database too
+    monkeypatch.setattr(database, "_engine", async_engine)
     async_session = sessionmaker(async_engine, class_=AsyncSession, expire_on_commit=False)
 
     async def override_get_db():
@@ -40,3 +59,83 @@ async def client(async_engine):
         yield ac
 
     app.dependency_overrides.clear()
+
+
+def _jpeg(shift: int = 0, brightness: int = 0) -> bytes:
+    img = Image.new("RGB", (320, 240), (200 + brightness, 200 + brightness, 200 + brightness))
+    draw = ImageDraw.Draw(img)
+    draw.rectangle((40 + shift, 60, 140 + shift, 200), fill=(40, 40, 120))
+    draw.ellipse((200, 30, 300, 130), fill=(150, 30, 30))
+    buffer = io.BytesIO()
+    img.save(buffer, "JPEG", quality=90)
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def make_jpeg():
+    """Build a small JPEG: a small ``shift`` or ``brightness`` gives a near duplicate, a large one a different photo."""
+    return _jpeg
+
+
+@pytest.fixture
+async def room(client):
+    """A property with one room, created through the API."""
+    property_id = (await client.post("/api/properties", json={"name": "Test Property"})).json()["id"]
+    return (await client.post(f"/api/properties/{property_id}/rooms", json={"name": "Kitchen"})).json()
+
+
+@pytest.fixture
+def new_check(client, room):
+    """Create a check for the room's property; ``photos`` is the URL to upload photos of the room to."""
+
+    async def create(check_type: str = "checkin") -> SimpleNamespace:
+        url = f"/api/properties/{room['property_id']}/checks"
+        check_id = (await client.post(url, json={"check_type": check_type})).json()["id"]
+        return SimpleNamespace(id=check_id, photos=f"/api/checks/{check_id}/photos/{room['id']}")
+
+    return create
+
+
+@pytest.fixture
+def upload_dir(monkeypatch, tmp_path):
+    monkeypatch.setattr(routes.settings, "upload_dir", str(tmp_path))
+    return tmp_path
+
+
+class FakeVision:
+    """Stands in for the vision model, recording calls and returning queued analyses (or a clean room)."""
+
+    def __init__(self) -> None:
+        self.analyses: list[dict] = []
+        self.comparison = {
+            "new_damage": [],
+            "missing_items": [],
+            "condition_change": "same",
+            "recommended_claim": False,
+            "estimated_damage_cost": 0.0,
+        }
+        self.error: Exception | None = None
+        self.analyze_calls: list[str] = []
+        self.compare_calls: list[str] = []
+
+    async def analyze(self, image_path: str, checklist_items: list[str], room_name: str) -> dict:
+        if self.error:
+            raise self.error
+        self.analyze_calls.append(image_path)
+        if self.analyses:
+            return self.analyses.pop(0)
+        return {"missing_items": [], "damage_detected": [], "cleanliness_issues": [], "condition_score": 9}
+
+    async def compare(self, before_path: str, after_path: str, room_name: str) -> dict:
+        self.compare_calls.append(room_name)
+        # Slow enough for concurrent requests to overlap
+        await asyncio.sleep(0.05)
+        return dict(self.comparison)
+
+
+@pytest.fixture
+def fake_vision(monkeypatch, upload_dir):
+    vision = FakeVision()
+    monkeypatch.setattr(routes, "analyze_room_photo", vision.analyze)
+    monkeypatch.setattr(routes, "compare_photos", vision.compare)
+    return vision
@@ -1,3 +1,17 @@
+import asyncio
+import hashlib
+
+import pytest
+
+from app import profiling
+from app.api import routes
+from app.database import get_db
+from app.main import app
+from app.services import vision_service
+from app.services.admission import AdmissionController
+from app.services.vision_service import FALLBACK_ANALYSIS, ModelState
+
+
 class TestProperties:
     async def test_create_property(self, client):
         response = await client.post("/api/properties", json={"name": "Beach House", "address": "123 Ocean Ave"})
@@ -145,3 +159,448 @@ class TestCostHistory:
         response = await client.get(f"/api/properties/{property_id}/cost-history")
         assert response.status_code == 200
         assert response.json() == []
+
+
+class TestBulkImportExport:
+    tree = {
+        "properties": [
+            {
+                "name": "Lake House",
+                "address": "1 Shore Rd",
+                "rooms": [
+                    {
+                        "name": "Kitchen",
+                        "room_type": "kitchen",
+                        "items": [{"name": "Kettle", "replacement_cost": 30.0}, {"name": "Toaster"}],
+                    },
+                    {"name": "Porch"},
+                ],
+            },
+            {"name": "Loft", "rooms": [{"name": "Bathroom", "room_type": "bathroom", "items": [{"name": "Towels"}]}]},
+        ]
+    }
+
+    async def test_bulk_import(self, client):
+        response = await client.post("/api/bulk/import", json=self.tree)
+        assert response.status_code == 200
+        data = response.json()
+        assert data["properties_created"] == 2
+        assert data["rooms_created"] == 3
+        assert data["items_created"] == 3
+
+        rooms = (await client.get(f"/api/properties/{data['property_ids'][0]}/rooms")).json()
+        assert [r["name"] for r in rooms] == ["Kitchen", "Porch"]
+        items = (await client.get(f"/api/rooms/{rooms[0]['id']}/items")).json()
+        assert {i["name"]: i["replacement_cost"] for i in items} == {"Kettle": 30.0, "Toaster": 0.0}
+
+    async def test_bulk_import_csv_file(self, client):
+        csv_text = (
+            "property_name,property_address,room_name,room_type,item_name,replacement_cost\n"
+            "Cabin,,Bedroom,bedroom,Lamp,25\n"
+            "Cabin,,Bedroom,bedroom,Pillow,\n"
+            "Cabin,,Deck,,,\n"
+        )
+        response = await client.post(
+            "/api/bulk/import/file", files={"file": ("tree.csv", csv_text.encode(), "text/csv")}
+        )
+        assert response.status_code == 200
+        assert response.json()["rooms_created"] == 2
+        assert response.json()["items_created"] == 2
+
+    async def test_bulk_import_invalid_csv(self, client):
+        csv_text = "property_name,room_name,room_type\nCabin,Bedroom,attic\n"
+        response = await client.post(
+            "/api/bulk/import/file", files={"file": ("tree.csv", csv_text.encode(), "text/csv")}
+        )
+        assert response.status_code == 422
+
+    async def test_bulk_import_csv_short_rows(self, client):
+        csv_text = "property_name,property_address,room_name,item_name\nCabin\nCabin,,Deck\n,\n"
+        response = await client.post(
+            "/api/bulk/import/file", files={"file": ("tree.csv", csv_text.encode(), "text/csv")}
+        )
+        # The last row has no property_name, which is reported rather than crashing
+        assert response.status_code == 422
+        assert "Line 4" in response.json()["detail"]
+
+        response = await client.post(
+            "/api/bulk/import/file", files={"file": ("tree.csv", csv_text.encode()[:-2], "text/csv")}
+        )
+        assert response.status_code == 200
+        assert response.json()["rooms_created"] == 1
+
+    async def test_bulk_import_file_not_utf8(self, client):
+        csv_text = "property_name,room_name\nCaf\u00e9,Salle\n"
+        response = await client.post(
+            "/api/bulk/import/file", files={"file": ("tree.csv", csv_text.encode("latin-1"), "text/csv")}
+        )
+        assert response.status_code == 422
+
+    async def test_bulk_export_round_trip(self, client):
+        await client.post("/api/bulk/import", json=self.tree)
+
+        response = await client.get("/api/bulk/export")
+        assert response.status_code == 200
+        assert response.json() == {
+            "properties": [
+                {
+                    **self.tree["properties"][0],
+                    "rooms": [
+                        {
+                            **self.tree["properties"][0]["rooms"][0],
+                            "items": [
+                                {"name": "Kettle", "replacement_cost": 30.0},
+                                {"name": "Toaster", "replacement_cost": 0.0},
+                            ],
+                        },
+                        {"name": "Porch", "room_type": "other", "items": []},
+                    ],
+                },
+                {
+                    "name": "Loft",
+                    "address": None,
+                    "rooms": [
+                        {
+                            "name": "Bathroom",
+                            "room_type": "bathroom",
+                            "items": [{"name": "Towels", "replacement_cost": 0.0}],
+                        }
+                    ],
+                },
+            ]
+        }
+
+        csv_response = await client.get("/api/bulk/export", params={"format": "csv"})
+        assert csv_response.status_code == 200
+        lines = csv_response.text.strip().splitlines()
+        assert lines[0] == "property_name,property_address,room_name,room_type,item_name,replacement_cost"
+        assert len(lines) == 5
+
+
+class TestVisionQueue:
+    async def test_get_vision_queue_metrics(self, client):
+        response = await client.get("/api/vision/queue")
+        assert response.status_code == 200
+        data = response.json()
+        assert data["in_flight"] == 0
+        assert set(data["queued_by_priority"]) == {"interactive", "background"}
+
+    async def test_upload_rejected_when_queue_full(self, client, monkeypatch, upload_dir, new_check):
+        monkeypatch.setattr(routes, "admission", AdmissionController(max_concurrency=0, max_queue=0, queue_timeout=1))
+        check = await new_check()
+
+        response = await client.post(check.photos, files={"file": ("room.jpg", b"not really a jpeg", "image/jpeg")})
+        assert response.status_code == 429
+        assert int(response.headers["Retry-After"]) >= 1
+        assert list(upload_dir.iterdir()) == []
+
+
+class TestHealth:
+    async def test_liveness(self, client):
+        response = await client.get("/api/health/live")
+        assert response.status_code == 200
+
+    async def test_readiness(self, client, monkeypatch):
+        state = ModelState()
+        monkeypatch.setattr(routes, "model_state", state)
+        response = await client.get("/api/health/ready")
+        assert response.status_code == 503
+        assert response.json()["ready"] is False
+
+        state.reachable = state.loaded = True
+        response = await client.get("/api/health/ready")
+        assert response.status_code == 200
+
+
+class TestPhotoDedup:
+    async def test_duplicate_upload_reuses_analysis(self, client, fake_vision, upload_dir, room, new_check, make_jpeg):
+        fake_vision.analyses = [
+            {"missing_items": ["Towels"], "damage_detected": [], "cleanliness_issues": [], "condition_score": 8}
+        ]
+        await client.post(f"/api/rooms/{room['id']}/items", json={"name": "Towels", "replacement_cost": 20.0})
+        url = (await new_check("checkout")).photos
+
+        first = (await client.post(url, files={"file": ("a.jpg", make_jpeg(), "image/jpeg")})).json()
+        exact = (await client.post(url, files={"file": ("b.jpg", make_jpeg(), "image/jpeg")})).json()
+        near = (
+            await client.post(url, files={"file": ("c.jpg", make_jpeg(shift=2, brightness=5), "image/jpeg")})
+        ).json()
+
+        assert len(fake_vision.analyze_calls) == 1
+        assert first["issues_created"] == 1
+        assert exact["duplicate_of"] == near["duplicate_of"] == first["photo_id"]
+        assert exact["issues_created"] == near["issues_created"] == 0
+        assert exact["analysis"]["missing_items"] == ["Towels"]
+        # Exact duplicates share the original file; near duplicates keep their own frame
+        assert len(list(upload_dir.iterdir())) == 2
+
+        history = (await client.get(f"/api/properties/{room['property_id']}/cost-history")).json()
+        assert len(history) == 1
+
+    async def test_concurrent_identical_uploads_are_linked(
+        self, client, fake_vision, upload_dir, room, new_check, make_jpeg, monkeypatch
+    ):
+        fake_vision.analyses = [{"missing_items": ["Towels"], "damage_detected": ["Torn curtain"]}]
+        await client.post(f"/api/rooms/{room['id']}/items", json={"name": "Towels", "replacement_cost": 20.0})
+        url = (await new_check("checkout")).photos
+
+        async def slow_analyze(image_path, checklist_items, room_name):
+            # Slow enough for all the uploads to be in flight at once
+            await asyncio.sleep(0.05)
+            return await fake_vision.analyze(image_path, checklist_items, room_name)
+
+        monkeypatch.setattr(routes, "analyze_room_photo", slow_analyze)
+        results = await asyncio.gather(
+            *(client.post(url, files={"file": (f"{i}.jpg", make_jpeg(), "image/jpeg")}) for i in range(3))
+        )
+        results = [r.json() for r in results]
+
+        assert len(fake_vision.analyze_calls) == 1
+        originals = [r for r in results if r["duplicate_of"] is None]
+        assert len(originals) == 1
+        assert all(r["duplicate_of"] == originals[0]["photo_id"] for r in results if r is not originals[0])
+        assert sum(r["issues_created"] for r in results) == 2
+        assert len(list(upload_dir.iterdir())) == 1
+
+        history = (await client.get(f"/api/properties/{room['property_id']}/cost-history")).json()
+        assert sorted(h["issue"]["description"] for h in history) == ["Missing: Towels", "Torn curtain"]
+        assert not routes.room_locks
+
+
+class TestIssueConsolidation:
+    async def test_issues_merged_across_photos_of_a_room(self, client, fake_vision, room, new_check, make_jpeg):
+        fake_vision.analyses = [
+            # An unparseable reply neither anchors nor resolves missing items
+            dict(FALLBACK_ANALYSIS),
+            {"missing_items": ["Towels", "Soap"], "damage_detected": ["Cracked mirror above the sink"]},
+            {"missing_items": ["Towels", "Hair dryer"], "damage_detected": ["Mirror cracked above sink"]},
+            dict(FALLBACK_ANALYSIS),
+            {"missing_items": ["Towels"], "damage_detected": ["Broken shower door"]},
+        ]
+        for name, cost in [("Towels", 20.0), ("Soap", 5.0), ("Hair dryer", 30.0)]:
+            await client.post(f"/api/rooms/{room['id']}/items", json={"name": name, "replacement_cost": cost})
+        url = (await new_check("checkout")).photos
+
+        results = [
+            (await client.post(url, files={"file": (f"{i}.jpg", make_jpeg(shift=60 * i), "image/jpeg")})).json()
+            for i in range(5)
+        ]
+        assert [(r["issues_created"], r["issues_resolved"]) for r in results] == [
+            (0, 0),
+            (3, 0),
+            (0, 1),
+            (0, 0),
+            (1, 0),
+        ]
+
+        history = (await client.get(f"/api/properties/{room['property_id']}/cost-history")).json()
+        descriptions = sorted(h["issue"]["description"] for h in history)
+        assert descriptions == ["Broken shower door", "Cracked mirror above the sink", "Missing: Towels"]
+        assert all(h["issue"]["room_id"] == room["id"] for h in history)
+
+
+class TestResumableUploads:
+    @pytest.fixture
+    async def url(self, fake_vision, new_check):
+        return f"{(await new_check()).photos}/uploads"
+
+    async def test_chunked_upload_resume_and_finalize(self, client, url, upload_dir, make_jpeg):
+        data = make_jpeg()
+        size = len(data)
+        half = size // 2
+
+        response = await client.post(
+            url, json={"filename": "kitchen.jpg", "size": size, "sha256": hashlib.sha256(data).hexdigest()}
+        )
+        assert response.status_code == 201
+        upload_id = response.json()["id"]
+
+        response = await client.put(
+            f"/api/uploads/{upload_id}", content=data[:half], headers={"Content-Range": f"bytes 0-{half - 1}/{size}"}
+        )
+        assert response.status_code == 200
+        assert response.headers["Upload-Offset"] == str(half)
+
+        # A retried chunk from the wrong offset is refused with the server's offset
+        response = await client.put(
+            f"/api/uploads/{upload_id}", content=data[:half], headers={"Content-Range": f"bytes 0-{half - 1}/{size}"}
+        )
+        assert response.status_code == 409
+        assert response.headers["Upload-Offset"] == str(half)
+
+        response = await client.post(f"/api/uploads/{upload_id}/finalize")
+        assert response.status_code == 409
+
+        offset = (await client.get(f"/api/uploads/{upload_id}")).json()["offset"]
+        response = await client.put(
+            f"/api/uploads/{upload_id}",
+            content=data[offset:],
+            headers={"Content-Range": f"bytes {offset}-{size - 1}/{size}"},
+        )
+        assert response.json()["offset"] == size
+
+        response = await client.post(f"/api/uploads/{upload_id}/finalize")
+        assert response.status_code == 200
+        assert response.json()["analysis"]["condition_score"] == 9
+        assert [p.read_bytes() for p in upload_dir.glob("*.jpg")] == [data]
+        assert (await client.get(f"/api/uploads/{upload_id}")).status_code == 404
+
+    async def test_failed_analysis_keeps_staged_upload(self, client, url, fake_vision, upload_dir, make_jpeg):
+        data = make_jpeg()
+        upload_id = (await client.post(url, json={"filename": "kitchen.jpg", "size": len(data)})).json()["id"]
+        await client.put(
+            f"/api/uploads/{upload_id}", content=data, headers={"Content-Range": f"bytes 0-{len(data) - 1}/{len(data)}"}
+        )
+
+        fake_vision.error = RuntimeError("model crashed")
+        with pytest.raises(RuntimeError):
+            await client.post(f"/api/uploads/{upload_id}/finalize")
+        assert list(upload_dir.glob("*.jpg")) == []
+        assert (await client.get(f"/api/uploads/{upload_id}")).json()["offset"] == len(data)
+
+        # The upload can simply be finalized again once the model is back
+        fake_vision.error = None
+        response = await client.post(f"/api/uploads/{upload_id}/finalize")
+        assert response.status_code == 200
+        assert [p.read_bytes() for p in upload_dir.glob("*.jpg")] == [data]
+
+    async def test_retried_finalize_during_analysis(
+        self, client, file_sessions, fake_vision, upload_dir, make_jpeg, monkeypatch
+    ):
+        # Each request gets its own connection, so the retry doesn't see the first one's uncommitted work
+        async def file_db():
+            async with file_sessions() as session:
+                yield session
+
+        monkeypatch.setitem(app.dependency_overrides, get_db, file_db)
+        property_id = (await client.post("/api/properties", json={"name": "Test Property"})).json()["id"]
+        room_id = (await client.post(f"/api/properties/{property_id}/rooms", json={"name": "Kitchen"})).json()["id"]
+        check_id = (await client.post(f"/api/properties/{property_id}/checks", json={"check_type": "checkin"})).json()[
+            "id"
+        ]
+        url = f"/api/checks/{check_id}/photos/{room_id}/uploads"
+
+        data = make_jpeg()
+        upload_id = (await client.post(url, json={"filename": "kitchen.jpg", "size": len(data)})).json()["id"]
+        await client.put(
+            f"/api/uploads/{upload_id}", content=data, headers={"Content-Range": f"bytes 0-{len(data) - 1}/{len(data)}"}
+        )
+        analyzing = asyncio.Event()
+
+        async def slow_analyze(image_path, checklist_items, room_name):
+            analyzing.set()
+            await asyncio.sleep(0.05)
+            return await fake_vision.analyze(image_path, checklist_items, room_name)
+
+        monkeypatch.setattr(routes, "analyze_room_photo", slow_analyze)
+        first = asyncio.create_task(client.post(f"/api/uploads/{upload_id}/finalize"))
+        await analyzing.wait()
+        retry = await client.post(f"/api/uploads/{upload_id}/finalize")
+        assert retry.status_code == 409
+
+        assert (await first).status_code == 200
+        assert len(fake_vision.analyze_calls) == 1
+        assert [p.read_bytes() for p in upload_dir.glob("*.jpg")] == [data]
+
+    async def test_finalize_rejects_checksum_mismatch(self, client, url):
+        response = await client.post(url, json={"size": 4, "sha256": "0" * 64})
+        upload_id = response.json()["id"]
+        await client.put(f"/api/uploads/{upload_id}", content=b"abcd", headers={"Content-Range": "bytes 0-3/4"})
+
+        response = await client.post(f"/api/uploads/{upload_id}/finalize")
+        assert response.status_code == 422
+        assert (await client.get(f"/api/uploads/{upload_id}")).json()["offset"] == 0
+
+    async def test_chunk_outside_upload_size(self, client, url):
+        upload_id = (await client.post(url, json={"size": 4})).json()["id"]
+        response = await client.put(
+            f"/api/uploads/{upload_id}", content=b"abcdef", headers={"Content-Range": "bytes 0-5/6"}
+        )
+        assert response.status_code == 400
+
+
+class TestDamageReportCoalescing:
+    async def test_concurrent_reports_share_one_model_call(self, client, fake_vision, room, new_check, make_jpeg):
+        fake_vision.comparison.update(
+            new_damage=["Scratched table"], condition_change="worse", recommended_claim=True, estimated_damage_cost=40.0
+        )
+        checks = {}
+        for check_type, shift in [("checkin", 0), ("checkout", 120)]:
+            checks[check_type] = await new_check(check_type)
+            await client.post(
+                checks[check_type].photos, files={"file": ("room.jpg", make_jpeg(shift=shift), "image/jpeg")}
+            )
+
+        url = f"/api/properties/{room['property_id']}/damage-report"
+        params = {"checkin_id": checks["checkin"].id, "checkout_id": checks["checkout"].id}
+        responses = await asyncio.gather(*[client.get(url, params=params) for _ in range(5)])
+
+        assert [r.status_code for r in responses] == [200] * 5
+        assert len(fake_vision.compare_calls) == 1
+        assert all(r.json() == responses[0].json() for r in responses)
+        assert responses[0].json()["comparison_photos"][0]["comparison"]["new_damage"] == ["Scratched table"]
+
+
+class TestProfiling:
+    admin = {"X-Admin-Token": "secret"}
+
+    @pytest.fixture(autouse=True)
+    def profiling_on(self, monkeypatch):
+        monkeypatch.setattr(profiling.settings, "profiling_enabled", True)
+        monkeypatch.setattr(profiling.settings, "admin_token", "secret")
+        monkeypatch.setattr(profiling, "traces", profiling.traces.__class__(maxlen=5))
+        monkeypatch.setattr(routes, "traces", profiling.traces)
+
+    async def test_slow_requests_are_captured(self, client, monkeypatch):
+        monkeypatch.setattr(profiling.settings, "profiling_slow_ms", 0)
+        monkeypatch.setattr(profiling.settings, "profiling_sample_rate", 1.0)
+
+        await client.post("/api/properties", json={"name": "Beach House"})
+        await client.get("/api/properties")
+
+        summaries = (await client.get("/api/admin/traces", headers=self.admin)).json()
+        assert [(s["method"], s["path"]) for s in summaries] == [
+            ("GET", "/api/properties"),
+            ("POST", "/api/properties"),
+        ]
+        assert summaries[0]["status"] == 200
+        assert summaries[0]["sql_count"] >= 1
+
+        trace = (await client.get(f"/api/admin/traces/{summaries[0]['id']}", headers=self.admin)).json()
+        assert any("FROM properties" in s["statement"] for s in trace["sql"])
+        assert "cumulative" in trace["profile"]
+
+    async def test_fast_requests_are_not_captured(self, client, monkeypatch):
+        monkeypatch.setattr(profiling.settings, "profiling_sample_rate", 0.0)
+
+        await client.get("/api/properties")
+        assert (await client.get("/api/admin/traces", headers=self.admin)).json() == []
+        assert (await client.get("/api/admin/traces/1", headers=self.admin)).status_code == 404
+
+    async def test_vision_calls_are_traced(self, client, monkeypatch, upload_dir, new_check, make_jpeg):
+        class FakeChat:
+            async def chat(self, **kwargs):
+                return {"message": {"content": '{"missing_items": [], "damage_detected": [], "condition_score": 8}'}}
+
+        monkeypatch.setattr(vision_service, "client", FakeChat())
+        check = await new_check()
+        monkeypatch.setattr(profiling.settings, "profiling_slow_ms", 0)
+        monkeypatch.setattr(profiling.settings, "profiling_sample_rate", 0.0)
+
+        await client.post(check.photos, files={"file": ("room.jpg", make_jpeg(), "image/jpeg")})
+
+        upload = (await client.get("/api/admin/traces", headers=self.admin)).json()[0]
+        assert upload["vision_count"] == 1
+        trace = (await client.get(f"/api/admin/traces/{upload['id']}", headers=self.admin)).json()
+        assert [s["name"] for s in trace["vision"]] == ["analyze_room_photo"]
+
+    async def test_traces_require_admin_token(self, client, monkeypatch):
+        assert (await client.get("/api/admin/traces")).status_code == 403
+        assert (await client.get("/api/admin/traces", headers={"X-Admin-Token": "wrong"})).status_code == 403
+
+        monkeypatch.setattr(profiling.settings, "admin_token", "")
+        assert (await client.get("/api/admin/traces", headers={"X-Admin-Token": ""})).status_code == 403
+
+    async def test_traces_hidden_when_profiling_disabled(self, client, monkeypatch):
+        monkeypatch.setattr(profiling.settings, "profiling_enabled", False)
+        assert (await client.get("/api/admin/traces", headers=self.admin)).status_code == 404
@@ -0,0 +1,490 @@
+import asyncio
+import os
+import subprocess
+import sys
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import ollama
+import pytest
+from PIL import Image
+from sqlalchemy import func, select
+
+from app import database
+from app.models import Check, CheckType, Lease, Photo, Property, UploadSession
+from app.services import coalesce_service, retention_service, upload_service, vision_service
+from app.services.admission import AdmissionController, AdmissionRejected, Priority
+from app.services.coalesce_service import KeyedLock, SingleFlight
+from app.services.dedup_service import content_hash, find_duplicate, hamming_distance, perceptual_hash
+from app.services.issue_service import is_similar_damage
+
+
+class TestAdmissionController:
+    async def _hold(self, controller, order, name, priority=Priority.INTERACTIVE, key=None, release=None):
+        async with controller.slot(priority, key):
+            order.append(name)
+            if release:
+                await release.wait()
+
+    async def test_limits_concurrency_and_prioritises_interactive(self):
+        controller = AdmissionController(max_concurrency=1, max_queue=10, queue_timeout=5)
+        order: list[str] = []
+        release = asyncio.Event()
+
+        blocker = asyncio.create_task(self._hold(controller, order, "blocker", release=release))
+        await asyncio.sleep(0)
+        background = asyncio.create_task(self._hold(controller, order, "background", Priority.BACKGROUND))
+        interactive = asyncio.create_task(self._hold(controller, order, "interactive", Priority.INTERACTIVE))
+        await asyncio.sleep(0)
+
+        metrics = controller.metrics()
+        assert metrics["in_flight"] == 1
+        assert metrics["queued_by_priority"] == {"interactive": 1, "background": 1}
+
+        release.set()
+        await asyncio.gather(blocker, background, interactive)
+        assert order == ["blocker", "interactive", "background"]
+        assert controller.metrics()["in_flight"] == 0
+
+    async def test_round_robin_across_properties(self):
+        controller = AdmissionController(max_concurrency=1, max_queue=10, queue_timeout=5)
+        order: list[str] = []
+        release = asyncio.Event()
+
+        blocker = asyncio.create_task(self._hold(controller, order, "blocker", release=release))
+        await asyncio.sleep(0)
+        tasks = [
+            asyncio.create_task(self._hold(controller, order, name, key=key))
+            for name, key in [("a1", 1), ("a2", 1), ("a3", 1), ("b1", 2)]
+        ]
+        await asyncio.sleep(0)
+
+        release.set()
+        await asyncio.gather(blocker, *tasks)
+        assert order == ["blocker", "a1", "b1", "a2", "a3"]
+
+    async def test_rejects_when_queue_full(self):
+        controller = AdmissionController(max_concurrency=1, max_queue=1, queue_timeout=5)
+        release = asyncio.Event()
+
+        blocker = asyncio.create_task(self._hold(controller, [], "blocker", release=release))
+        waiter = asyncio.create_task(self._hold(controller, [], "waiter"))
+        await asyncio.sleep(0)
+
+        with pytest.raises(AdmissionRejected) as exc_info:
+            async with controller.slot():
+                pass
+        assert exc_info.value.retry_after >= 1
+        assert controller.metrics()["rejected_total"] == 1
+
+        release.set()
+        await asyncio.gather(blocker, waiter)
+
+    async def test_queue_timeout_frees_waiter(self):
+        controller = AdmissionController(max_concurrency=1, max_queue=5, queue_timeout=0.01)
+        release = asyncio.Event()
+        blocker = asyncio.create_task(self._hold(controller, [], "blocker", release=release))
+        await asyncio.sleep(0)
+
+        with pytest.raises(AdmissionRejected):
+            async with controller.slot():
+                pass
+        assert controller.metrics()["queued"] == 0
+
+        release.set()
+        await blocker
+        assert controller.metrics()["in_flight"] == 0
+
+
+class FakeOllama:
+    def __init__(self, running: list[str] | None = None, error: Exception | None = None):
+        self.running = running or []
+        self.error = error
+        self.generate_calls: list[dict] = []
+
+    async def ps(self):
+        if self.error:
+            raise self.error
+        return SimpleNamespace(models=[SimpleNamespace(model=name, name=name) for name in self.running])
+
+    async def generate(self, **kwargs):
+        if self.error:
+            raise self.error
+        self.generate_calls.append(kwargs)
+        self.running.append(kwargs["model"])
+
+
+class TestModelWarmup:
+    @pytest.fixture(autouse=True)
+    def state(self, monkeypatch):
+        state = vision_service.ModelState()
+        monkeypatch.setattr(vision_service, "model_state", state)
+        monkeypatch.setattr(vision_service.settings, "ollama_model", "llava")
+        monkeypatch.setattr(vision_service.settings, "ollama_preload", True)
+        return state
+
+    async def test_check_model_unreachable(self, monkeypatch, state):
+        monkeypatch.setattr(vision_service, "client", FakeOllama(error=ConnectionError("refused")))
+        await vision_service.check_model()
+        assert not state.reachable
+        assert not state.ready
+        assert state.last_error == "refused"
+
+    async def test_check_model_reachable_but_not_loaded(self, monkeypatch, state):
+        monkeypatch.setattr(vision_service, "client", FakeOllama(running=["mistral:latest"]))
+        await vision_service.check_model()
+        assert state.reachable
+        assert not state.loaded
+        assert not state.ready
+
+    async def test_keep_model_warm_preloads_with_keep_alive(self, monkeypatch, state):
+        fake = FakeOllama()
+        monkeypatch.setattr(vision_service, "client", fake)
+        monkeypatch.setattr(vision_service.settings, "ollama_keep_alive", "1h")
+        state.reachable = True
+
+        task = asyncio.create_task(vision_service.keep_model_warm(0.01))
+        await asyncio.sleep(0.05)
+        task.cancel()
+
+        # Every tick refreshes the keep-alive, not just the first
+        assert len(fake.generate_calls) >= 2
+        assert all(call == {"model": "llava", "prompt": "", "keep_alive": "1h"} for call in fake.generate_calls)
+        assert state.ready
+
+    async def test_keep_model_warm_survives_failures(self, monkeypatch, state):
+        fake = FakeOllama()
+        monkeypatch.setattr(vision_service, "client", fake)
+        failures = []
+        ps = fake.ps
+
+        async def flaky_ps():
+            if not failures:
+                failures.append(1)
+                raise RuntimeError("unexpected reply")
+            return await ps()
+
+        fake.ps = flaky_ps
+        task = asyncio.create_task(vision_service.keep_model_warm(0.01))
+        await asyncio.sleep(0.05)
+        task.cancel()
+
+        assert failures and len(fake.generate_calls) >= 2
+        assert state.ready
+
+
+class TestPhotoDedup:
+    def test_near_duplicates_have_close_perceptual_hashes(self, make_jpeg):
+        original = perceptual_hash(make_jpeg())
+        burst_frame = perceptual_hash(make_jpeg(shift=2, brightness=5))
+        different = perceptual_hash(make_jpeg(shift=120))
+        assert hamming_distance(original, burst_frame) <= 6
+        assert hamming_distance(original, different) > 6
+
+    def test_perceptual_hash_of_non_image(self):
+        assert perceptual_hash(b"not an image") is None
+
+    def test_find_duplicate_prefers_exact_match(self, make_jpeg):
+        data = make_jpeg()
+        near = Photo(id=1, content_hash="other", perceptual_hash=perceptual_hash(data))
+        exact = Photo(id=2, content_hash=content_hash(data), perceptual_hash=perceptual_hash(make_jpeg(shift=120)))
+        assert find_duplicate([near, exact], content_hash(data), perceptual_hash(data), 6) is exact
+        assert find_duplicate([near], content_hash(data), perceptual_hash(data), 6) is near
+        assert find_duplicate([near], content_hash(data), perceptual_hash(make_jpeg(shift=120)), 6) is None
+
+
+class TestIssueConsolidation:
+    def test_similar_damage(self):
+        assert is_similar_damage("Red wine stain on the carpet", "Wine stain on carpet")
+        assert is_similar_damage("Cracked mirror", "cracked mirror.")
+        assert not is_similar_damage("Wine stain on carpet", "Broken lamp shade")
+        assert not is_similar_damage("Scratch on left nightstand", "Scratch on right nightstand")
+        assert not is_similar_damage("Hole in bedroom wall", "Hole in hallway wall")
+        assert not is_similar_damage("Large hole in bedroom wall", "Large hole in hallway wall")
+        assert not is_similar_damage("Scratch", "Scratch on left nightstand")
+
+
+class TestUploadSessions:
+    async def test_expire_upload_sessions(self, db_session, monkeypatch, tmp_path):
+        monkeypatch.setattr(upload_service.settings, "upload_dir", str(tmp_path))
+        stale = UploadSession(id="stale", check_id=1, room_id=1, size=10, offset=5)
+        fresh = UploadSession(id="fresh", check_id=1, room_id=1, size=10, offset=5)
+        db_session.add_all([stale, fresh])
+        await db_session.commit()
+        stale.updated_at = datetime.utcnow() - timedelta(days=2)
+        await db_session.commit()
+
+        os.makedirs(tmp_path / ".partial")
+        for name in ["stale", "fresh", "orphan"]:
+            (tmp_path / ".partial" / f"{name}.part").write_bytes(b"12345")
+        old = (datetime.utcnow() - timedelta(days=2)).timestamp()
+        for name in ["stale", "orphan"]:
+            os.utime(tmp_path / ".partial" / f"{name}.part", (old, old))
+
+        assert await upload_service.expire_upload_sessions(db_session, ttl=3600) == 1
+        assert sorted(p.name for p in (tmp_path / ".partial").iterdir()) == ["fresh.part"]
+        assert await db_session.get(UploadSession, "fresh") is not None
+
+
+class TestCoalescing:
+    async def test_single_flight_shares_result(self):
+        flight = SingleFlight()
+        calls = []
+
+        async def work():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return "done"
+
+        results = await asyncio.gather(*[flight.do("key", work) for _ in range(10)])
+        assert results == ["done"] * 10
+        assert len(calls) == 1
+        assert flight.in_flight() == 0
+
+    async def test_keyed_lock_serializes_per_key(self):
+        locks = KeyedLock()
+        order = []
+
+        async def work(key, name):
+            async with locks.hold(key):
+                order.append(f"{name} start")
+                await asyncio.sleep(0.01)
+                order.append(f"{name} end")
+
+        await asyncio.gather(work("a", "a1"), work("a", "a2"), work("b", "b1"))
+        assert order.index("a1 end") < order.index("a2 start")
+        assert order.index("b1 start") < order.index("a1 end")
+        assert len(locks) == 0
+
+    async def test_lease_shared_across_replicas(self, file_sessions, monkeypatch):
+        monkeypatch.setattr(coalesce_service.settings, "coalesce_poll_interval", 0.01)
+        calls = []
+
+        async def work():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return {"total": 42}
+
+        async def replica():
+            # Each replica has its own process-local state, so only the lease can coalesce them
+            async with file_sessions() as db:
+                return await coalesce_service.run_with_lease(db, "report:1", work)
+
+        assert await asyncio.gather(replica(), replica(), replica()) == [{"total": 42}] * 3
+        assert len(calls) == 1
+
+    async def test_finished_result_not_served_to_new_callers(self, file_sessions, monkeypatch):
+        monkeypatch.setattr(coalesce_service.settings, "coalesce_result_ttl", 60.0)
+        calls = []
+
+        async def work():
+            calls.append(1)
+            return {"total": len(calls)}
+
+        async with file_sessions() as db:
+            assert await coalesce_service.run_with_lease(db, "report:3", work) == {"total": 1}
+            # Still within the result TTL, but this request arrived after the report was built
+            assert await coalesce_service.run_with_lease(db, "report:3", work) == {"total": 2}
+
+    async def test_expired_results_are_deleted(self, file_sessions, monkeypatch):
+        monkeypatch.setattr(coalesce_service.settings, "coalesce_result_ttl", 0.0)
+
+        async def work():
+            return {"total": 0}
+
+        async with file_sessions() as db:
+            await coalesce_service.run_with_lease(db, "report:4", work)
+            await asyncio.sleep(0.01)
+            await coalesce_service.run_with_lease(db, "report:5", work)
+            keys = set((await db.execute(select(Lease.key))).scalars())
+        assert keys == {"report:5"}
+
+    async def test_coalesce_outlives_cancelled_caller(self, async_engine, monkeypatch):
+        monkeypatch.setattr(database, "_engine", async_engine)
+
+        async def work(db):
+            await asyncio.sleep(0.05)
+            return (await db.execute(select(func.count(Photo.id)))).scalar_one()
+
+        first = asyncio.create_task(coalesce_service.coalesce("report:2", work))
+        second = asyncio.create_task(coalesce_service.coalesce("report:2", work))
+        await asyncio.sleep(0.01)
+        # The computation has its own session, so the first caller going away doesn't break it
+        first.cancel()
+        assert await second == 0
+
+
+class TestRetention:
+    async def test_apply_retention(self, db_session, monkeypatch, tmp_path, make_jpeg):
+        uploads, archive = tmp_path / "uploads", tmp_path / "archive"
+        uploads.mkdir()
+        monkeypatch.setattr(retention_service.settings, "upload_dir", str(uploads))
+        monkeypatch.setattr(retention_service.settings, "archive_dir", str(archive))
+        now = datetime.utcnow()
+        long_ago = now - timedelta(days=200)
+
+        big = Image.effect_noise((800, 600), 64).convert("RGB")
+        big.save(uploads / "old.png")
+        (uploads / "closed.jpg").write_bytes(make_jpeg())
+        (uploads / "recent.jpg").write_bytes(make_jpeg(shift=10))
+        for name in ["orphan.jpg", "fresh-orphan.jpg"]:
+            (uploads / name).write_bytes(b"x" * 100)
+        os.utime(uploads / "orphan.jpg", (long_ago.timestamp(), long_ago.timestamp()))
+
+        prop = Property(name="Test Property")
+        db_session.add(prop)
+        await db_session.flush()
+        old_checkin = Check(property_id=prop.id, check_type=CheckType.CHECKIN, created_at=long_ago)
+        new_checkin = Check(property_id=prop.id, check_type=CheckType.CHECKIN, created_at=now)
+        db_session.add_all([old_checkin, new_checkin])
+        await db_session.flush()
+        db_session.add_all(
+            [
+                Photo(
+                    check_id=new_checkin.id,
+                    room_id=1,
+                    file_path=str(uploads / "old.png"),
+                    created_at=now - timedelta(days=40),
+                ),
+                Photo(check_id=old_checkin.id, room_id=1, file_path=str(uploads / "closed.jpg"), created_at=now),
+                Photo(check_id=new_checkin.id, room_id=1, file_path=str(uploads / "recent.jpg"), created_at=now),
+            ]
+        )
+        await db_session.commit()
+        old_size = os.path.getsize(uploads / "old.png")
+
+        dry_run = await retention_service.apply_retention(db_session, dry_run=True, now=now)
+        assert (dry_run["recompressed"], dry_run["archived"], dry_run["orphans_deleted"]) == (1, 1, 1)
+        assert (uploads / "orphan.jpg").exists()
+
+        report = await retention_service.apply_retention(db_session, now=now)
+        assert (report["recompressed"], report["archived"], report["orphans_deleted"]) == (1, 1, 1)
+        assert report["bytes_reclaimed"] == report["recompressed_bytes_saved"] + 100
+        assert sorted(p.name for p in uploads.iterdir()) == ["fresh-orphan.jpg", "old.jpg", "recent.jpg"]
+        assert [p.name for p in archive.iterdir()] == ["closed.jpg"]
+        assert os.path.getsize(uploads / "old.jpg") < old_size
+
+        paths = set((await db_session.execute(select(Photo.file_path))).scalars())
+        assert paths == {str(uploads / "old.jpg"), str(archive / "closed.jpg"), str(uploads / "recent.jpg")}
+
+        # A second run has nothing left to do
+        again = await retention_service.apply_retention(db_session, now=now)
+        assert again["bytes_reclaimed"] == again["archived"] == again["recompressed"] == 0
+
+    async def test_recompress_failure_keeps_earlier_files_consistent(self, db_session, monkeypatch, tmp_path):
+        monkeypatch.setattr(retention_service.settings, "upload_dir", str(tmp_path))
+        monkeypatch.setattr(retention_service.settings, "archive_dir", str(tmp_path / "archive"))
+        now = datetime.utcnow()
+        prop = Property(name="Test Property")
+        db_session.add(prop)
+        await db_session.flush()
+        check = Check(property_id=prop.id, check_type=CheckType.CHECKIN, created_at=now)
+        db_session.add(check)
+        await db_session.flush()
+        for name in ["first.png", "second.png"]:
+            Image.effect_noise((400, 300), 64).convert("RGB").save(tmp_path / name)
+            db_session.add(
+                Photo(check_id=check.id, room_id=1, file_path=str(tmp_path / name), created_at=now - timedelta(days=40))
+            )
+        await db_session.commit()
+
+        calls = []
+        real_recompress = retention_service.recompress_file
+
+        def failing_recompress(path, quality, max_dimension):
+            calls.append(path)
+            if len(calls) == 2:
+                raise OSError("disk full")
+            return real_recompress(path, quality, max_dimension)
+
+        monkeypatch.setattr(retention_service, "recompress_file", failing_recompress)
+        with pytest.raises(OSError):
+            await retention_service.apply_retention(db_session, now=now)
+        await db_session.rollback()
+
+        # The file converted before the failure is committed, and every row points at a file that exists
+        assert sorted(calls) == [str(tmp_path / "first.png"), str(tmp_path / "second.png")]
+        converted = os.path.splitext(calls[0])[0] + ".jpg"
+        paths = set((await db_session.execute(select(Photo.file_path))).scalars())
+        assert paths == {converted, calls[1]}
+        assert all(os.path.exists(path) for path in paths)
+        assert not os.path.exists(calls[0])
+
+    async def test_run_retention_survives_failures(self, async_engine, monkeypatch):
+        monkeypatch.setattr(database, "_engine", async_engine)
+        runs = []
+
+        async def flaky_retention(db):
+            runs.append(1)
+            if len(runs) == 1:
+                raise OSError("disk full")
+            return {"bytes_reclaimed": 0}
+
+        monkeypatch.setattr(retention_service, "apply_retention", flaky_retention)
+        task = asyncio.create_task(retention_service.run_retention(0.01))
+        await asyncio.sleep(0.1)
+        task.cancel()
+        # Let it close its session before the engine is disposed
+        await asyncio.gather(task, return_exceptions=True)
+        assert len(runs) >= 2
+
+
+class TestLazyStartup:
+    def test_import_builds_nothing(self, tmp_path):
+        upload_dir = tmp_path / "uploads"
+        code = (
+            "import app.main\n"
+            "from app import database\n"
+            "from app.services import vision_service\n"
+            "print(database._engine is None, vision_service.client is None)"
+        )
+        env = {**os.environ, "UPLOAD_DIR": str(upload_dir), "ARCHIVE_DIR": str(tmp_path / "archive")}
+        result = subprocess.run(
+            [sys.executable, "-c", code], capture_output=True, text=True, check=True, env=env, cwd=os.getcwd()
+        )
+        assert result.stdout.split() == ["True", "True"]
+        assert not upload_dir.exists()
+
+    async def test_engine_built_on_first_use_and_disposed(self, monkeypatch, tmp_path):
+        monkeypatch.setattr(database, "_engine", None)
+        monkeypatch.setattr(database.settings, "database_url", f"sqlite+aiosqlite:///{tmp_path / 'lazy.db'}")
+        engine = database.get_engine()
+        assert database.get_engine() is engine
+        async with database.async_session() as db:
+            assert db.bind is engine
+        await database.dispose_engine()
+        assert database._engine is None
+
+    def test_client_built_on_first_use(self, monkeypatch):
+        monkeypatch.setattr(vision_service, "client", None)
+        client = vision_service.get_client()
+        assert isinstance(client, ollama.AsyncClient)
+        assert vision_service.get_client() is client
+
+    async def test_run_once_per_runs_once_across_workers(self, file_sessions):
+        calls = []
+
+        async def work():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return len(calls)
+
+        async def worker():
+            async with file_sessions() as db:
+                return await coalesce_service.run_once_per(db, "maintenance", 60, work)
+
+        results = await asyncio.gather(worker(), worker())
+        assert sorted(results, key=lambda r: r is None) == [1, None]
+        assert len(calls) == 1
+
+    async def test_run_once_per_releases_lease_on_failure(self, db_session):
+        async def fail():
+            raise RuntimeError("boom")
+
+        async def work():
+            return "ran"
+
+        with pytest.raises(RuntimeError):
+            await coalesce_service.run_once_per(db_session, "maintenance", 60, fail)
+        # The failed run gave the lease back, so the retry doesn't wait out the period
+        assert await coalesce_service.run_once_per(db_session, "maintenance", 60, work) == "ran"